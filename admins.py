@@ -0,0 +1,77 @@
+import asyncio
+
+from db import DB
+
+ROLES = ("owner", "admin")
+
+
+class AdminRegistry:
+    """
+    Админы и роли из таблицы admins, копия в памяти процесса: проверка прав — поиск в dict, без БД.
+    Перечитывается по NOTIFY admins (см. DB.set_admin/remove_admin) и на всякий случай раз в ttl секунд —
+    если уведомление потерялось вместе с соединением LISTEN.
+    """
+
+    def __init__(self, db: DB, ttl: float = 300.0):
+        self.db = db
+        self.ttl = ttl
+        self._roles: dict[int, str] = {}
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._roles
+
+    def role(self, user_id: int) -> str | None:
+        return self._roles.get(user_id)
+
+    def is_owner(self, user_id: int) -> bool:
+        return self._roles.get(user_id) == "owner"
+
+    def items(self) -> list[tuple[int, str]]:
+        # владельцы первыми, дальше по id
+        return sorted(self._roles.items(), key=lambda kv: (ROLES.index(kv[1]), kv[0]))
+
+    def invalidate(self, *_args) -> None:
+        self._wake.set()
+
+    async def refresh(self) -> None:
+        # словарь подменяется целиком — читатели никогда не видят его наполовину заполненным
+        self._roles = await self.db.list_admins()
+
+    async def set(self, user_id: int, role: str, added_by: int | None = None) -> None:
+        await self.db.set_admin(user_id, role, added_by)
+        # свой процесс видит изменение сразу, не дожидаясь NOTIFY
+        self._roles = {**self._roles, user_id: role}
+
+    async def remove(self, user_id: int) -> bool:
+        removed = await self.db.remove_admin(user_id)
+        self._roles = {uid: r for uid, r in self._roles.items() if uid != user_id}
+        return removed
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.ttl)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._stopping:
+                break
+            try:
+                await self.refresh()
+            except Exception as e:
+                # оставляем прежний список — лучше старые права, чем никаких
+                print(f"[admins] WARN: refresh failed: {e!r}")
@@ -0,0 +1,259 @@
+"""
+Офлайн-бенчмарки горячих путей (без сети): нормализация, поиск блюд, рендер карточки/клавиатуры,
+поиск строк в Sheets по ID на подставном листе.
+
+    python bench.py                                # все размеры каталога, JSON в stdout
+    python bench.py --sizes 50,1000 --out now.json
+    python bench.py --compare base.json            # код 1, если что-то стало медленнее порога
+    python bench.py --dsn postgresql://...         # + DB.search_dishes на реальной базе (только чтение)
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import statistics
+from functools import cache
+from pathlib import Path
+
+import sheets
+from dish_index import DishIndex, normalize
+from fakes import FakeDishDB, FakeWorksheet
+from main import card_text, dish_keyboard, search_dishes_strict
+
+SIZES = (50, 1_000, 10_000, 100_000)
+
+_SUFFIXES = ["по-домашнему", "с зеленью", "на гриле", "в сливках", "острый", "от шефа", "сезонный"]
+
+
+@cache
+def _words() -> list[str]:
+    with open(Path(__file__).with_name("dishes.txt"), encoding="utf-8") as f:
+        return [w for line in f for w in line.split() if len(w) > 2]
+
+
+def catalog(n: int, seed: int = 1) -> list[str]:
+    """
+    Синтетический каталог из слов dishes.txt: детерминированный, n уникальных названий.
+    """
+    words = _words()
+    rnd = random.Random(seed)
+    names: set[str] = set()
+    while len(names) < n:
+        k = rnd.randint(2, 4)
+        name = " ".join(rnd.choice(words) for _ in range(k)).capitalize()
+        if rnd.random() < 0.3:
+            name += " " + rnd.choice(_SUFFIXES)
+        if name in names:
+            name += f" №{len(names)}"
+        names.add(name)
+    return sorted(names)
+
+
+def queries(names: list[str], seed: int = 2) -> dict[str, list[str]]:
+    rnd = random.Random(seed)
+    sample = rnd.sample(names, min(20, len(names)))
+    return {
+        "prefix": [normalize(n)[:4] for n in sample],
+        "multiword": [" ".join(w[:4] for w in normalize(n).split()[:2]) for n in sample],
+        # опечатка: в индексе пусто, уходим в запасной поиск
+        "typo": [normalize(n).split()[0][:-1] + "ъ" for n in sample],
+    }
+
+
+def measure(fn, repeat: int = 5, min_time: float = 0.05) -> dict:
+    """
+    fn() — одна операция. Калибруем число повторов так, чтобы прогон шёл не меньше min_time,
+    затем repeat прогонов; результат — наносекунды на операцию.
+    """
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - t0 >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+
+    per_op = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_op.append((time.perf_counter() - t0) / number * 1e9)
+    return {
+        "ns_per_op": statistics.median(per_op),
+        "min_ns": min(per_op),
+        "max_ns": max(per_op),
+        "ops": number * repeat,
+    }
+
+
+def measure_async(loop: asyncio.AbstractEventLoop, make_coro, **kwargs) -> dict:
+    # событийный цикл один на весь прогон — меряем саму корутину, а не asyncio.run
+    return measure(lambda: loop.run_until_complete(make_coro()), **kwargs)
+
+
+def _cycle(items: list):
+    it = iter(())
+
+    def nxt():
+        nonlocal it
+        try:
+            return next(it)
+        except StopIteration:
+            it = iter(items)
+            return next(it)
+
+    return nxt
+
+
+def bench_normalize(results: list, names: list[str]) -> None:
+    nxt = _cycle(names)
+    results.append({"name": "normalize", "size": len(names), **measure(lambda: normalize(nxt()))})
+
+
+def bench_index(results: list, loop, names: list[str]) -> None:
+    n = len(names)
+    results.append({
+        "name": "dish_index.load",
+        "size": n,
+        **measure(lambda: DishIndex().load(names), repeat=3, min_time=0.01),
+    })
+
+    db = FakeDishDB(names)
+    for kind, qs in queries(names).items():
+        nxt = _cycle(qs)
+        results.append({"name": f"dish_index.search.{kind}", "size": n, **measure(lambda: db.dishes.search(nxt()))})
+        nxt2 = _cycle(qs)
+        results.append({
+            "name": f"search_dishes_strict.{kind}",
+            "size": n,
+            **measure_async(loop, lambda: search_dishes_strict(db, nxt2())),
+        })
+
+
+def bench_render(results: list, names: list[str]) -> None:
+    opts = names[:10]
+    nxt = _cycle(names)
+    results.append({"name": "dish_keyboard", "size": len(opts), **measure(lambda: dish_keyboard(opts))})
+    results.append({
+        "name": "card_text",
+        "size": 1,
+        **measure(lambda: card_text(12345, "17/10/26", nxt(), "Пересолено, подали холодным", "Учтём, спасибо")),
+    })
+
+
+def bench_sheets(results: list, rows: int) -> None:
+    ws = FakeWorksheet.with_ids(rows)
+    sheets._worksheet = ws  # _ws() вернёт подставной лист
+    rnd = random.Random(3)
+    ids = [str(rnd.randint(1, rows)) for _ in range(200)]
+
+    nxt = _cycle(ids)
+    sheets._rows = None
+    sheets._find_rows(ws, [ids[0]])
+    results.append({"name": "sheets.find_rows.cached", "size": rows, **measure(lambda: sheets._find_rows(ws, [nxt()]))})
+
+    def cold():
+        sheets._rows = None
+        sheets._find_rows(ws, [nxt()])
+
+    results.append({"name": "sheets.find_rows.rebuild", "size": rows, **measure(cold, repeat=3)})
+
+    batch = ids[:50]
+
+    def write_batch():
+        sheets._write_batch({}, {fid: [fid, "17/10/26", "Блюдо", "комментарий", "ответ"] for fid in batch}, [])
+
+    results.append({"name": "sheets.write_batch.update50", "size": rows, **measure(write_batch)})
+    sheets._worksheet = None
+    sheets._rows = None
+
+
+def bench_db(results: list, loop, dsn: str) -> None:
+    from db import DB
+
+    db = DB(dsn)
+    loop.run_until_complete(db.connect())
+    try:
+        names = loop.run_until_complete(db.list_dishes())
+        if not names:
+            print("[bench] WARN: dishes table is empty, skipping DB.search_dishes", file=sys.stderr)
+            return
+        for kind, qs in queries(names).items():
+            nxt = _cycle(qs)
+            results.append({
+                "name": f"db.search_dishes.{kind}",
+                "size": len(names),
+                **measure_async(loop, lambda: db.search_dishes(nxt()), repeat=3),
+            })
+    finally:
+        loop.run_until_complete(db.close())
+
+
+def compare(results: list, baseline_path: str, threshold: float) -> list[str]:
+    with open(baseline_path, encoding="utf-8") as f:
+        base = {(r["name"], r["size"]): r["ns_per_op"] for r in json.load(f)["results"]}
+    slower = []
+    for r in results:
+        old = base.get((r["name"], r["size"]))
+        if old and r["ns_per_op"] > old * threshold:
+            slower.append(f"{r['name']}[{r['size']}]: {old:.0f} -> {r['ns_per_op']:.0f} ns/op")
+    return slower
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Offline micro-benchmarks")
+    ap.add_argument("--sizes", default=",".join(map(str, SIZES)), help="dish catalog sizes, comma separated")
+    ap.add_argument("--out", help="write JSON here instead of stdout")
+    ap.add_argument("--compare", help="baseline JSON from a previous run")
+    ap.add_argument("--threshold", type=float, default=1.25, help="slowdown factor that counts as regression")
+    ap.add_argument("--dsn", help="also benchmark DB.search_dishes against this database (read-only)")
+    args = ap.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    results: list[dict] = []
+    loop = asyncio.new_event_loop()
+    try:
+        for n in sizes:
+            names = catalog(n)
+            print(f"[bench] catalog {n}", file=sys.stderr)
+            bench_normalize(results, names)
+            bench_index(results, loop, names)
+            bench_sheets(results, n)
+        bench_render(results, catalog(50))
+        if args.dsn:
+            bench_db(results, loop, args.dsn)
+    finally:
+        loop.close()
+
+    for r in results:
+        print(f"{r['name']:<36} {r['size']:>7}  {r['ns_per_op']:>14,.0f} ns/op", file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        slower = compare(results, args.compare, args.threshold)
+        for line in slower:
+            print(f"[bench] REGRESSION: {line}", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import time
+import asyncio
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from db import DB
+
+
+class TokenBucket:
+    """
+    Глобальный лимитер отправок: rate сообщений в секунду, всплеск до capacity.
+    По умолчанию capacity=1 — без всплеска: ни в одну секунду не уходит больше rate
+    (всплеск в rate сверху давал бы до 2×rate в первую секунду).
+    pause() — общая пауза для всех (Telegram вернул RetryAfter).
+    """
+
+    def __init__(self, rate: float = 25.0, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _retry_after_seconds(e: RetryAfter) -> float:
+    ra = e.retry_after
+    return float(ra.total_seconds()) if hasattr(ra, "total_seconds") else float(ra)
+
+
+async def send_limited(bot: Bot, limiter: TokenBucket, chat_id: int, text: str, attempts: int = 3) -> None:
+    """
+    Одна отправка через лимитер. RetryAfter — пауза для всех и повтор,
+    сетевые ошибки — повтор, Forbidden/BadRequest — сразу наружу.
+    """
+    for attempt in range(1, attempts + 1):
+        await limiter.acquire()
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, disable_web_page_preview=True)
+            return
+        except RetryAfter as e:
+            limiter.pause(_retry_after_seconds(e))
+            if attempt == attempts:
+                raise
+        except (Forbidden, BadRequest):
+            raise
+        except NetworkError:
+            if attempt == attempts:
+                raise
+            await asyncio.sleep(attempt)
+
+
+class JobLost(Exception):
+    """Аренду задания перехватил другой процесс — он и продолжит рассылку."""
+
+
+def is_dead_chat(e: Exception) -> bool:
+    # бот заблокирован, пользователь удалён, чата больше нет — повторять бессмысленно
+    if isinstance(e, Forbidden):
+        return True
+    return isinstance(e, BadRequest) and "chat not found" in e.message.lower()
+
+
+class Broadcast:
+    """
+    Одно задание рассылки (строка broadcast_jobs).
+    Получатели читаются страницами по keyset-курсору (следующая подгружается, пока шлём текущую),
+    внутри страницы — concurrency параллельных отправок через общий TokenBucket.
+    После каждой страницы результаты и курсор сохраняются — после рестарта продолжаем с того же места.
+    Чаты, ответившие Forbidden/«chat not found», выключаются той же транзакцией и в следующие рассылки не попадают.
+    Задание шлёт только его владелец owner: аренда продлевается раз в lease/3 секунд, и если её перехватили
+    (процесс «завис» дольше lease), рассылка останавливается — JobLost.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        limiter: TokenBucket,
+        db: DB,
+        job,
+        owner: str,
+        lease: float = 60.0,
+        concurrency: int = 10,
+        page_size: int = 100,
+    ):
+        self.bot = bot
+        self.limiter = limiter
+        self.db = db
+        self.job_id: int = job["id"]
+        self.text: str = job["text"]
+        self.admin_chat_id: int | None = job["admin_chat_id"]
+        self.progress_message_id: int | None = job["progress_message_id"]
+        self.cursor: int | None = job["last_chat_id"]
+        self.total: int = job["total"]
+        self.sent: int = job["sent"]
+        self.failed: int = job["failed"]
+        self.pruned = 0
+        self.owner = owner
+        self.lease = lease
+        self.lost = False
+        self.concurrency = concurrency
+        self.page_size = page_size
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    async def _send_page(self, chat_ids: list[int]) -> tuple[list[tuple[int, str, str | None]], list[int]]:
+        results: list[tuple[int, str, str | None]] = []
+        dead: list[int] = []
+        it = iter(chat_ids)
+
+        async def worker():
+            for cid in it:
+                try:
+                    await send_limited(self.bot, self.limiter, cid, self.text)
+                    self.sent += 1
+                    results.append((cid, "sent", None))
+                except Exception as e:
+                    self.failed += 1
+                    results.append((cid, "failed", repr(e)))
+                    if is_dead_chat(e):
+                        dead.append(cid)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, self.concurrency))))
+        return results, dead
+
+    async def _heartbeat(self) -> None:
+        # между страницами аренду продлевает record_deliveries; это — на долгие страницы и паузы RetryAfter
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                if not await self.db.heartbeat_broadcast_job(self.job_id, self.owner):
+                    self.lost = True
+                    return
+            except Exception as e:
+                print(f"[broadcast] WARN: job #{self.job_id}: heartbeat failed: {e!r}")
+
+    async def run(self) -> None:
+        beat = asyncio.create_task(self._heartbeat())
+        next_page = asyncio.create_task(self.db.broadcast_page(self.job_id, self.cursor, self.page_size))
+        try:
+            while True:
+                page = await next_page
+                if not page:
+                    break
+                if self.lost:
+                    raise JobLost(self.job_id)
+                next_page = asyncio.create_task(self.db.broadcast_page(self.job_id, page[-1], self.page_size))
+                results, dead = await self._send_page(page)
+                owned = await self.db.record_deliveries(self.job_id, results, page[-1], dead, self.owner)
+                self.pruned += len(dead)
+                self.cursor = page[-1]
+                if not owned:
+                    raise JobLost(self.job_id)
+        finally:
+            beat.cancel()
+            if not next_page.done():
+                next_page.cancel()
+        await self.db.finish_broadcast_job(self.job_id)
+
+
+def progress_text(b: Broadcast, finished: bool = False, failed: bool = False) -> str:
+    if failed:
+        return f"❌ Рассылка прервана ошибкой.\nОтправлено: {b.sent}\nОшибок: {b.failed}"
+    if finished:
+        text = f"✅ Рассылка завершена.\nОтправлено: {b.sent}\nОшибок: {b.failed}"
+        if b.pruned:
+            text += f"\nНедоступных чатов отключено: {b.pruned}"
+        return text
+    return f"📤 Рассылка: {b.done}/{b.total}\nОтправлено: {b.sent}\nОшибок: {b.failed}"
+
+
+async def run_with_progress(b: Broadcast, every: float = 3.0) -> None:
+    """
+    Фоновая задача: рассылка + периодическое обновление сообщения с прогрессом у админа.
+    """
+
+    async def report(finished: bool = False, failed: bool = False):
+        if not b.admin_chat_id or not b.progress_message_id:
+            return
+        try:
+            await b.bot.edit_message_text(
+                chat_id=b.admin_chat_id,
+                message_id=b.progress_message_id,
+                text=progress_text(b, finished, failed),
+            )
+        except Exception:
+            pass
+
+    task = asyncio.create_task(b.run())
+    last = -1
+    while not task.done():
+        await asyncio.wait({task}, timeout=every)
+        if not task.done() and b.done != last:
+            last = b.done
+            await report()
+    try:
+        task.result()
+    except JobLost:
+        # рассылку продолжает новый владелец, его прогресс — его забота
+        print(f"[broadcast] WARN: job #{b.job_id}: lease taken over by another process, stopping")
+        return
+    except Exception as e:
+        print(f"[broadcast] ERROR: job #{b.job_id}: {e!r}")
+        try:
+            await b.db.fail_broadcast_job(b.job_id, b.owner, repr(e))
+        except Exception as e2:
+            # не записали — задание останется running, аренда истечёт и его подхватят снова
+            print(f"[broadcast] ERROR: job #{b.job_id}: fail_broadcast_job failed: {e2!r}")
+            return
+        await report(failed=True)
+        return
+    await report(finished=True)
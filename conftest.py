@@ -0,0 +1,13 @@
+import pytest
+
+import sheets
+from fakes import FakeWorksheet
+
+
+@pytest.fixture
+def ws(monkeypatch):
+    # строка 1 — заголовок, ID i лежит в строке i + 1; глобалы sheets вернутся после теста
+    ws = FakeWorksheet.with_ids(5)
+    monkeypatch.setattr(sheets, "_worksheet", ws)
+    monkeypatch.setattr(sheets, "_rows", None)
+    return ws
@@ -1,121 +1,901 @@
+import os
+import json
+import time
+import asyncio
+from datetime import date
+from contextlib import asynccontextmanager
+
 import asyncpg
 
-CREATE_SQL = """
-CREATE TABLE IF NOT EXISTS dishes (
-  id SERIAL PRIMARY KEY,
-  name TEXT UNIQUE NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS feedback (
-  id SERIAL PRIMARY KEY,
-  feedback_date DATE NOT NULL,
-  dish_name TEXT NOT NULL,
-  guest_comment TEXT NOT NULL,
-  kitchen_reply TEXT NULL,
-  telegram_chat_id BIGINT NULL,
-  telegram_message_id BIGINT NULL,
-  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-);
-
-CREATE INDEX IF NOT EXISTS idx_dishes_name ON dishes (name);
-CREATE INDEX IF NOT EXISTS idx_feedback_id ON feedback (id);
+import metrics
+from dish_index import DishIndex, normalize
+from migrations import migrate
+
+# Реестр горячих запросов: на каждом соединении пула они готовятся заранее (см. DB._init_connection),
+# все запросы статические — никаких f-строк, план кэшируется.
+# Колонки feedback явно, без *: подготовленный запрос с * ломается (InvalidCachedStatementError),
+# если миграция на другой реплике поменяет таблицу; asyncpg переподготавливает только свой кэш запросов.
+_FEEDBACK_COLUMNS = """
+    id, feedback_date, dish_name, guest_comment, kitchen_reply,
+    telegram_chat_id, telegram_message_id, group_chat_id, group_message_id, created_at
 """
+_FEEDBACK_COLUMNS_F = ", ".join("f." + c.strip() for c in _FEEDBACK_COLUMNS.split(","))
+
+STATEMENTS: dict[str, str] = {
+    "search_dishes": """
+        SELECT name
+        FROM dishes
+        WHERE name_norm LIKE $1 OR $2 <% name_norm
+        ORDER BY name_norm LIKE $1 DESC, word_similarity($2, name_norm) DESC, name
+        LIMIT $3
+    """,
+    # /dadd, новое блюдо из диалога и импорт — один путь (DB._insert_dishes): дубль по name_norm
+    # (регистр, ё→е, пробелы — то же выражение, что у колонки) не вставляется
+    "insert_dishes": """
+        INSERT INTO dishes(name)
+        SELECT t.name
+        FROM unnest($1::text[]) AS t(name)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM dishes d
+            WHERE d.name_norm = replace(lower(regexp_replace(btrim(t.name), '[[:space:]]+', ' ', 'g')), 'ё', 'е')
+        )
+        ON CONFLICT (name) DO NOTHING
+        RETURNING name
+    """,
+    "lock_dishes": "SELECT pg_advisory_xact_lock(7305002)",
+    "insert_feedback": """
+        INSERT INTO feedback(feedback_date, dish_name, guest_comment, kitchen_reply)
+        VALUES($1, $2, $3, $4)
+        RETURNING """ + _FEEDBACK_COLUMNS,
+    "get_feedback": "SELECT " + _FEEDBACK_COLUMNS + " FROM feedback WHERE id=$1",
+    "set_message_refs": """
+        UPDATE feedback
+        SET telegram_chat_id=$2, telegram_message_id=$3
+        WHERE id=$1
+    """,
+    # old_reply — чтобы поправить сводку, если запись стала/перестала быть «с ответом»
+    "update_kitchen_reply": """
+        UPDATE feedback f
+        SET kitchen_reply=$2
+        FROM (SELECT id, kitchen_reply AS old_reply FROM feedback WHERE id=$1 FOR UPDATE) o
+        WHERE f.id = o.id
+        RETURNING """ + _FEEDBACK_COLUMNS_F + """, o.old_reply
+    """,
+    "bump_daily_stats": """
+        INSERT INTO feedback_daily_stats AS s (day, dish_name, total, replied)
+        VALUES($1, $2, $3, $4)
+        ON CONFLICT (day, dish_name) DO UPDATE
+        SET total = s.total + EXCLUDED.total, replied = s.replied + EXCLUDED.replied
+    """,
+    "delete_feedback": "DELETE FROM feedback WHERE id=$1 RETURNING " + _FEEDBACK_COLUMNS,
+    "set_group_message_refs": "UPDATE feedback SET group_chat_id=$2, group_message_id=$3 WHERE id=$1 RETURNING id",
+    "upsert_subscriber": """
+        INSERT INTO subscribers(chat_id, chat_type)
+        VALUES($1, $2)
+        ON CONFLICT (chat_id) DO UPDATE SET chat_type=EXCLUDED.chat_type, active=TRUE, deactivated_at=NULL
+    """,
+    "enqueue_outbox": "INSERT INTO outbox(feedback_id, kind, payload) VALUES($1, $2, $3::jsonb)",
+    "notify_outbox": "SELECT pg_notify('outbox', '')",
+    # Берём головное событие каждой записи в каждом канале (sheets / group: порядок внутри
+    # (feedback_id, channel) сохраняется) и «арендуем» его на lease секунд, чтобы не держать
+    # транзакцию на время отправки. Мёртвые события (status='dead') очередь не держат.
+    "claim_outbox": """
+        UPDATE outbox
+        SET next_attempt_at = NOW() + make_interval(secs => $2)
+        WHERE id IN (
+            SELECT o.id
+            FROM outbox o
+            WHERE o.status = 'pending'
+              AND o.next_attempt_at <= NOW()
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox p
+                  WHERE p.feedback_id = o.feedback_id AND p.channel = o.channel
+                    AND p.status = 'pending' AND p.id < o.id
+              )
+            ORDER BY o.id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, feedback_id, kind, payload, attempts
+    """,
+    "complete_outbox": "DELETE FROM outbox WHERE id = ANY($1::bigint[])",
+    "retry_outbox": """
+        UPDATE outbox
+        SET attempts = attempts + 1,
+            last_error = $3,
+            next_attempt_at = NOW() + make_interval(secs => $2)
+        WHERE id = $1
+    """,
+    "dead_outbox": "UPDATE outbox SET status='dead', attempts = attempts + 1, last_error = $2 WHERE id = $1",
+    "broadcast_page": """
+        SELECT s.chat_id
+        FROM subscribers s
+        WHERE s.active
+          AND ($2::bigint IS NULL OR s.chat_id > $2)
+          AND NOT EXISTS (
+              SELECT 1 FROM broadcast_deliveries d
+              WHERE d.job_id = $1 AND d.chat_id = s.chat_id
+          )
+        ORDER BY s.chat_id
+        LIMIT $3
+    """,
+    # Журнал ОС: keyset по (feedback_date, id), новые сверху; одна индексная выборка на страницу.
+    # older — записи до курсора, не раньше $3; newer — после курсора, не позже $3.
+    "feedback_older": """
+        SELECT id, feedback_date, dish_name, guest_comment, kitchen_reply
+        FROM feedback
+        WHERE (feedback_date, id) < ($1, $2) AND feedback_date >= $3
+        ORDER BY feedback_date DESC, id DESC
+        LIMIT $4
+    """,
+    "feedback_newer": """
+        SELECT id, feedback_date, dish_name, guest_comment, kitchen_reply
+        FROM feedback
+        WHERE (feedback_date, id) > ($1, $2) AND feedback_date <= $3
+        ORDER BY feedback_date, id
+        LIMIT $4
+    """,
+    "feedback_older_dish": """
+        SELECT id, feedback_date, dish_name, guest_comment, kitchen_reply
+        FROM feedback
+        WHERE dish_name = $5 AND (feedback_date, id) < ($1, $2) AND feedback_date >= $3
+        ORDER BY feedback_date DESC, id DESC
+        LIMIT $4
+    """,
+    "feedback_newer_dish": """
+        SELECT id, feedback_date, dish_name, guest_comment, kitchen_reply
+        FROM feedback
+        WHERE dish_name = $5 AND (feedback_date, id) > ($1, $2) AND feedback_date <= $3
+        ORDER BY feedback_date, id
+        LIMIT $4
+    """,
+    "insert_delivery": """
+        INSERT INTO broadcast_deliveries(job_id, chat_id, status, error)
+        VALUES($1, $2, $3, $4)
+        ON CONFLICT (job_id, chat_id) DO NOTHING
+    """,
+    # изменения подписчиков/блюд для кэшей остальных процессов (DB.listen)
+    "notify": "SELECT pg_notify($1, $2)",
+    "notify_subscribers_gone": "SELECT pg_notify('subscribers', '-' || c) FROM unnest($1::bigint[]) AS c",
+    "notify_dishes_added": "SELECT pg_notify('dishes', '+' || n) FROM unnest($1::text[]) AS n",
+    "deactivate_subscribers": """
+        UPDATE subscribers
+        SET active=FALSE, deactivated_at=NOW()
+        WHERE chat_id = ANY($1::bigint[]) AND active
+    """,
+    # курсор двигает только владелец задания (заодно продлевает аренду); RETURNING пусто — задание перехватили
+    "advance_broadcast_job": """
+        UPDATE broadcast_jobs
+        SET last_chat_id=$2, sent=sent+$3, failed=failed+$4, heartbeat_at=NOW()
+        WHERE id=$1 AND owner=$5 AND status='running'
+        RETURNING id
+    """,
+}
+
+class _Connection(asyncpg.Connection):
+    # подготовленные выражения из STATEMENTS (заполняются в DB._init_connection)
+    __slots__ = ("stmts",)
+
+
+async def _run(conn, name: str, method: str, *args):
+    """
+    Выполнить запрос из реестра: через подготовленное выражение соединения,
+    а если подготовка выключена (DB_STATEMENT_CACHE_SIZE=0, pgbouncer) — обычным запросом.
+    method: fetch / fetchrow / fetchval / executemany.
+    """
+    stmts = getattr(conn, "stmts", None)
+    if stmts:
+        return await getattr(stmts[name], method)(*args)
+    return await getattr(conn, method)(STATEMENTS[name], *args)
+
+
+def _env(name: str, default: str) -> str:
+    return (os.getenv(name) or default).strip()
+
+
+class PoolStats:
+    """
+    Счётчики выдачи соединений из пула: сколько раз, сколько ждали, сколько раз пул был занят целиком.
+    """
+
+    def __init__(self):
+        self.acquired = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.saturated = 0
+        self.timeouts = 0
+
+    def record(self, wait: float, saturated: bool) -> None:
+        self.acquired += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        if saturated:
+            self.saturated += 1
+
+
+def _has_reply(reply: str | None) -> int:
+    return 1 if (reply or "").strip() else 0
+
+
+def sheet_payload(row) -> dict:
+    return {
+        "date": row["feedback_date"].strftime("%d/%m/%y"),
+        "dish": row["dish_name"],
+        "comment": row["guest_comment"],
+        "reply": row["kitchen_reply"],
+    }
+
 
 class DB:
     def __init__(self, dsn: str):
         self.dsn = dsn
         self.pool: asyncpg.Pool | None = None
+        self.dishes = DishIndex()
+        # активные подписчики: /start у уже подписанного не ходит в БД (см. main._autoregister_subscriber);
+        # изменения из других процессов приходят через NOTIFY subscribers
+        self.subscribers: set[int] = set()
+        self._listen_conn: asyncpg.Connection | None = None
+        self._listeners: dict[str, list] = {}  # канал -> callback(payload)
+        self._resync: list = []  # async-функции полной перечитки кэшей после переподключения LISTEN
+        self._listen_task: asyncio.Task | None = None
+        self._dish_replay: list[tuple[str, str]] | None = None
+        self.listen_reconnects = 0
+        self.stats = PoolStats()
+
+        # размеры/таймауты пула — из окружения
+        self.min_size = int(_env("DB_POOL_MIN", "1"))
+        self.max_size = int(_env("DB_POOL_MAX", "5"))
+        self.acquire_timeout = float(_env("DB_POOL_TIMEOUT", "10"))
+        self.command_timeout = float(_env("DB_COMMAND_TIMEOUT", "30"))
+        self.statement_cache_size = int(_env("DB_STATEMENT_CACHE_SIZE", "100"))
+        self.max_inactive_lifetime = float(_env("DB_POOL_MAX_INACTIVE", "300"))
+        self.listen_check = float(_env("DB_LISTEN_CHECK", "30"))
 
     async def connect(self):
-        self.pool = await asyncpg.create_pool(dsn=self.dsn, min_size=1, max_size=5)
-        async with self.pool.acquire() as conn:
-            await conn.execute(CREATE_SQL)
+        if self.pool:
+            return
+        # миграции — до пула: новым соединениям пула нужны уже существующие таблицы
+        conn = await asyncpg.connect(dsn=self.dsn)
+        try:
+            await migrate(conn)
+        finally:
+            await conn.close()
+
+        self.pool = await asyncpg.create_pool(
+            dsn=self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            max_inactive_connection_lifetime=self.max_inactive_lifetime,
+            command_timeout=self.command_timeout,
+            statement_cache_size=self.statement_cache_size,
+            connection_class=_Connection,
+            init=self._init_connection if self.statement_cache_size > 0 else None,
+        )
+
+    async def _init_connection(self, conn: _Connection) -> None:
+        conn.stmts = {name: await conn.prepare(sql) for name, sql in STATEMENTS.items()}
+
+    @asynccontextmanager
+    async def acquire(self, query: str = "other"):
+        """
+        Соединение из пула с учётом метрик: время ожидания, насыщение, таймауты;
+        всё время от запроса соединения до возврата — в bot_db_query_seconds{query}.
+        """
+        assert self.pool
+        with metrics.timed(metrics.DB_SECONDS, metrics.DB_ERRORS, query):
+            saturated = self.pool.get_idle_size() == 0 and self.pool.get_size() >= self.pool.get_max_size()
+            t0 = time.perf_counter()
+            try:
+                ctx = self.pool.acquire(timeout=self.acquire_timeout)
+                conn = await ctx.__aenter__()
+            except asyncio.TimeoutError:
+                self.stats.timeouts += 1
+                raise
+            self.stats.record(time.perf_counter() - t0, saturated)
+            try:
+                yield conn
+            finally:
+                await ctx.__aexit__(None, None, None)
+
+    @asynccontextmanager
+    async def transaction(self, query: str = "other"):
+        async with self.acquire(query) as conn, conn.transaction():
+            yield conn
+
+    async def _q(self, name: str, method: str, *args):
+        async with self.acquire(name) as conn:
+            return await _run(conn, name, method, *args)
+
+    def pool_stats(self) -> dict:
+        size = self.pool.get_size() if self.pool else 0
+        idle = self.pool.get_idle_size() if self.pool else 0
+        st = self.stats
+        return {
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "acquired": st.acquired,
+            "wait_total_seconds": st.wait_total,
+            "wait_avg_ms": (st.wait_total / st.acquired * 1000) if st.acquired else 0.0,
+            "wait_max_ms": st.wait_max * 1000,
+            "saturated": st.saturated,
+            "timeouts": st.timeouts,
+            "listen_reconnects": self.listen_reconnects,
+        }
 
     async def close(self):
+        if self._listen_task:
+            self._listen_task.cancel()
+            self._listen_task = None
+        if self._listen_conn:
+            await self._listen_conn.close()
         if self.pool:
             await self.pool.close()
 
-    async def search_dishes(self, query: str, limit: int = 10) -> list[str]:
-        q = " ".join(query.strip().split())
-        if len(q) < 2:
-            return []
+    async def listen(self, channel: str, callback, resync=None) -> None:
+        """
+        LISTEN на отдельном соединении (не из пула): callback(payload) на каждый NOTIFY.
+        Соединение проверяется раз в DB_LISTEN_CHECK секунд; оборвалось — переподключаемся,
+        подписываемся на все каналы заново и вызываем resync() (async): уведомления за время обрыва
+        потеряны, кэш надо перечитать целиком.
+        """
+        self._listeners.setdefault(channel, []).append(callback)
+        if resync is not None:
+            self._resync.append(resync)
+        if self._listen_conn is None:
+            self._listen_conn = await asyncpg.connect(dsn=self.dsn)
+        if len(self._listeners[channel]) == 1:
+            await self._listen_conn.add_listener(channel, self._dispatch)
+        if self._listen_task is None:
+            self._listen_task = asyncio.create_task(self._watch_listen())
 
-    async def delete_feedback(self, fid: int) -> None:
-        await self.pool.execute("DELETE FROM feedback WHERE id=$1", fid)
+    def _dispatch(self, _conn, _pid, channel: str, payload: str) -> None:
+        for callback in self._listeners.get(channel, ()):
+            callback(payload)
+
+    async def _watch_listen(self) -> None:
+        while True:
+            await asyncio.sleep(self.listen_check)
+            try:
+                await self._listen_conn.fetchval("SELECT 1", timeout=self.listen_check)
+                continue
+            except Exception as e:
+                print(f"[db] WARN: LISTEN connection lost: {e!r}, reconnecting")
+            await self._relisten()
 
-        parts = [p for p in q.split(" ") if p]
-        # Собираем WHERE: name ILIKE $1 AND name ILIKE $2 ...
-        conds = " AND ".join([f"name ILIKE ${i+1}" for i in range(len(parts))])
-        params = [f"%{p}%" for p in parts] + [limit]
+    async def _relisten(self) -> None:
+        old, self._listen_conn = self._listen_conn, None
+        if old is not None:
+            old.terminate()
+        delay = 1.0
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn=self.dsn)
+                for channel in self._listeners:
+                    await conn.add_listener(channel, self._dispatch)
+                break
+            except Exception as e:
+                if conn is not None:
+                    conn.terminate()
+                print(f"[db] WARN: LISTEN reconnect failed: {e!r}, retry in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.listen_check)
+        self._listen_conn = conn
+        self.listen_reconnects += 1
+        print(f"[db] LISTEN reconnected ({', '.join(self._listeners)}), reloading caches")
+        for resync in self._resync:
+            try:
+                await resync()
+            except Exception as e:
+                # не вышло — кэш останется прежним до следующего обрыва; лучше старый, чем никакого
+                print(f"[db] ERROR: resync after reconnect failed: {e!r}")
 
-        sql = f"""
-            SELECT name
-            FROM dishes
-            WHERE {conds}
-            ORDER BY name
-            LIMIT ${len(parts)+1}
+    async def search_dishes(self, query: str, limit: int = 10) -> list[str]:
+        """
+        Один запрос по name_norm через pg_trgm:
+        совпадение всех слов по порядку (LIKE) либо похожее слово (опечатки, <%).
+        Сначала точные по подстроке, дальше по убыванию похожести.
         """
+        q = normalize(query)
+        if len(q) < 2:
+            return []
 
-        rows = await self.pool.fetch(sql, *params)
+        parts = [p.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") for p in q.split(" ")]
+        pattern = "%" + "%".join(parts) + "%"
+
+        rows = await self._q("search_dishes", "fetch", pattern, q, limit)
         return [r["name"] for r in rows]
 
+    async def delete_feedback(self, fid: int) -> None:
+        async with self.transaction("delete_feedback") as conn:
+            row = await _run(conn, "delete_feedback", "fetchrow", fid)
+            if not row:
+                return
+            await self._bump_stats(conn, row["feedback_date"], row["dish_name"], -1, -_has_reply(row["kitchen_reply"]))
+            events = [("sheets_delete", {})]
+            if row["group_chat_id"] and row["group_message_id"]:
+                events.append((
+                    "group_delete",
+                    {"chat_id": int(row["group_chat_id"]), "message_id": int(row["group_message_id"])},
+                ))
+            await self._enqueue(conn, fid, events)
+
     async def upsert_subscriber(self, chat_id: int, chat_type: str = "private") -> None:
-        await self.pool.execute(
-            """
-            INSERT INTO subscribers(chat_id, chat_type)
-            VALUES($1, $2)
-            ON CONFLICT (chat_id) DO UPDATE SET chat_type=EXCLUDED.chat_type
-            """,
-            chat_id, chat_type
-        )
+        async with self.transaction("upsert_subscriber") as conn:
+            await _run(conn, "upsert_subscriber", "fetch", chat_id, chat_type)
+            await _run(conn, "notify", "fetch", "subscribers", f"+{chat_id}")
+        self.subscribers.add(chat_id)
 
     async def remove_subscriber(self, chat_id: int) -> None:
-        await self.pool.execute("DELETE FROM subscribers WHERE chat_id=$1", chat_id)
+        async with self.transaction("remove_subscriber") as conn:
+            await conn.execute("DELETE FROM subscribers WHERE chat_id=$1", chat_id)
+            await _run(conn, "notify", "fetch", "subscribers", f"-{chat_id}")
+        self.subscribers.discard(chat_id)
 
     async def list_subscribers(self) -> list[int]:
-        rows = await self.pool.fetch("SELECT chat_id FROM subscribers")
+        async with self.acquire("list_subscribers") as conn:
+            rows = await conn.fetch("SELECT chat_id FROM subscribers WHERE active")
         return [int(r["chat_id"]) for r in rows]
 
-    async def upsert_dish(self, name: str):
-        assert self.pool
-        q = "INSERT INTO dishes(name) VALUES($1) ON CONFLICT (name) DO NOTHING"
-        await self.pool.execute(q, name.strip())
+    async def load_subscribers(self) -> None:
+        # сначала LISTEN, потом чтение — изменения между ними не теряются
+        await self.listen("subscribers", self._on_subscriber_notify, resync=self.reload_subscribers)
+        await self.reload_subscribers()
 
-    async def create_feedback(self, feedback_date, dish_name: str, guest_comment: str, kitchen_reply: str | None):
-        assert self.pool
-        q = """
-        INSERT INTO feedback(feedback_date, dish_name, guest_comment, kitchen_reply)
-        VALUES($1, $2, $3, $4)
-        RETURNING id
+    async def reload_subscribers(self) -> None:
+        self.subscribers = set(await self.list_subscribers())
+
+    def _on_subscriber_notify(self, payload: str) -> None:
+        # "+chat_id" / "-chat_id" от любого процесса, включая свой (повтор безвреден)
+        chat_id = int(payload[1:])
+        if payload[0] == "+":
+            self.subscribers.add(chat_id)
+        else:
+            self.subscribers.discard(chat_id)
+
+    async def count_subscribers(self) -> int:
+        async with self.acquire("count_subscribers") as conn:
+            return await conn.fetchval("SELECT COUNT(*) FROM subscribers WHERE active")
+
+    # ---------- Admins ----------
+    async def list_admins(self) -> dict[int, str]:
+        async with self.acquire("list_admins") as conn:
+            rows = await conn.fetch("SELECT user_id, role FROM admins")
+        return {int(r["user_id"]): r["role"] for r in rows}
+
+    async def seed_admins(self, user_ids: set[int]) -> int:
         """
-        return await self.pool.fetchval(q, feedback_date, dish_name, guest_comment, kitchen_reply)
+        ADMIN_IDS из окружения -> owner, только пока таблица пуста: дальше список ведут командами,
+        и удалённый через /admin_del не вернётся после рестарта.
+        """
+        if not user_ids:
+            return 0
+        async with self.transaction("seed_admins") as conn:
+            added = await conn.fetch(
+                """
+                INSERT INTO admins(user_id, role)
+                SELECT unnest($1::bigint[]), 'owner'
+                WHERE NOT EXISTS (SELECT 1 FROM admins)
+                ON CONFLICT (user_id) DO NOTHING
+                RETURNING user_id
+                """,
+                list(user_ids),
+            )
+            if added:
+                await conn.execute("SELECT pg_notify('admins', '')")
+        return len(added)
 
-    async def set_message_refs(self, feedback_id: int, chat_id: int, message_id: int):
-        assert self.pool
-        q = """
-        UPDATE feedback
-        SET telegram_chat_id=$2, telegram_message_id=$3
-        WHERE id=$1
+    async def set_admin(self, user_id: int, role: str, added_by: int | None = None) -> None:
+        # NOTIFY в той же транзакции: остальные процессы сбросят кэш только после коммита
+        async with self.transaction("set_admin") as conn:
+            await conn.execute(
+                """
+                INSERT INTO admins(user_id, role, added_by) VALUES($1, $2, $3)
+                ON CONFLICT (user_id) DO UPDATE SET role = EXCLUDED.role
+                """,
+                user_id, role, added_by,
+            )
+            await conn.execute("SELECT pg_notify('admins', '')")
+
+    async def remove_admin(self, user_id: int) -> bool:
+        async with self.transaction("remove_admin") as conn:
+            res = await conn.execute("DELETE FROM admins WHERE user_id=$1", user_id)
+            if res == "DELETE 0":
+                return False
+            await conn.execute("SELECT pg_notify('admins', '')")
+        return True
+
+    # ---------- Broadcast jobs ----------
+    async def create_broadcast_job(self, text: str, admin_chat_id: int, total: int, owner: str):
+        # задание сразу принадлежит создавшему процессу — другие реплики его не подхватят, пока идёт heartbeat
+        async with self.acquire("create_broadcast_job") as conn:
+            return await conn.fetchrow(
+                """
+                INSERT INTO broadcast_jobs(text, admin_chat_id, total, owner, heartbeat_at)
+                VALUES($1, $2, $3, $4, NOW())
+                RETURNING *
+                """,
+                text, admin_chat_id, total, owner,
+            )
+
+    async def set_broadcast_progress_message(self, job_id: int, message_id: int) -> None:
+        async with self.acquire("set_broadcast_progress_message") as conn:
+            await conn.execute(
+                "UPDATE broadcast_jobs SET progress_message_id=$2 WHERE id=$1", job_id, message_id
+            )
+
+    async def claim_broadcast_jobs(self, owner: str, lease: float):
+        """
+        Забрать незавершённые задания без живого владельца: heartbeat не продлевался дольше lease секунд
+        (процесс упал или остановлен) либо его нет вовсе (задания до аренды). Одно задание — одному процессу.
+        """
+        async with self.acquire("claim_broadcast_jobs") as conn:
+            return await conn.fetch(
+                """
+                UPDATE broadcast_jobs
+                SET owner=$1, heartbeat_at=NOW()
+                WHERE id IN (
+                    SELECT id FROM broadcast_jobs
+                    WHERE status='running'
+                      AND (heartbeat_at IS NULL OR heartbeat_at < NOW() - make_interval(secs => $2))
+                    ORDER BY id
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+                """,
+                owner, float(lease),
+            )
+
+    async def heartbeat_broadcast_job(self, job_id: int, owner: str) -> bool:
+        # False — задание уже не наше (перехвачено после просроченной аренды) или не running
+        async with self.acquire("heartbeat_broadcast_job") as conn:
+            return await conn.fetchval(
+                """
+                UPDATE broadcast_jobs SET heartbeat_at=NOW()
+                WHERE id=$1 AND owner=$2 AND status='running'
+                RETURNING id
+                """,
+                job_id, owner,
+            ) is not None
+
+    async def broadcast_page(self, job_id: int, after_chat_id: int | None, limit: int) -> list[int]:
+        """
+        Следующая страница получателей (keyset по chat_id), без тех, кому уже доставляли.
+        """
+        rows = await self._q("broadcast_page", "fetch", job_id, after_chat_id, limit)
+        return [int(r["chat_id"]) for r in rows]
+
+    async def record_deliveries(
+        self,
+        job_id: int,
+        results: list[tuple[int, str, str | None]],
+        last_chat_id: int,
+        dead: list[int] | None = None,
+        owner: str | None = None,
+    ) -> bool:
+        """
+        Результаты страницы + сдвиг курсора задания + выключение мёртвых чатов (dead) — одной транзакцией.
+        Доставки пишутся в любом случае (новый владелец их не повторит), курсор — только владельцем owner.
+        Возвращает False, если задание больше не наше.
+        """
+        sent = sum(1 for _, status, _ in results if status == "sent")
+        async with self.transaction("record_deliveries") as conn:
+            await _run(
+                conn, "insert_delivery", "executemany",
+                [(job_id, cid, status, error) for cid, status, error in results],
+            )
+            owned = await _run(
+                conn, "advance_broadcast_job", "fetchval", job_id, last_chat_id, sent, len(results) - sent, owner
+            )
+            if dead:
+                await _run(conn, "deactivate_subscribers", "fetch", dead)
+                await _run(conn, "notify_subscribers_gone", "fetch", dead)
+        self.subscribers.difference_update(dead or ())
+        return owned is not None
+
+    async def finish_broadcast_job(self, job_id: int) -> None:
+        async with self.acquire("finish_broadcast_job") as conn:
+            await conn.execute(
+                "UPDATE broadcast_jobs SET status='done', finished_at=NOW() WHERE id=$1", job_id
+            )
+
+    async def fail_broadcast_job(self, job_id: int, owner: str, error: str) -> None:
+        # задача рассылки упала: не оставляем running без владельца до следующего рестарта
+        async with self.acquire("fail_broadcast_job") as conn:
+            await conn.execute(
+                """
+                UPDATE broadcast_jobs SET status='failed', finished_at=NOW(), last_error=$3
+                WHERE id=$1 AND owner=$2 AND status='running'
+                """,
+                job_id, owner, error,
+            )
+
+    async def upsert_dish(self, name: str) -> bool:
+        """
+        Одно блюдо по тем же правилам, что и импорт. False — такое (с точностью до нормализации) уже есть.
+        """
+        added, _ = await self.bulk_upsert_dishes([name])
+        return added > 0
+
+    async def bulk_upsert_dishes(self, names) -> tuple[int, int]:
+        """
+        Пачка блюд одним запросом: чистим пробелы, дедуплицируем по нормализованному
+        названию (регистр, ё→е), вставляем только тех, кого ещё нет по name_norm.
+        Возвращает (добавлено, уже было).
+        """
+        uniq: dict[str, str] = {}
+        for name in names:
+            name = " ".join((name or "").split())
+            if name:
+                uniq.setdefault(normalize(name), name)
+        if not uniq:
+            return 0, 0
+
+        async with self.transaction("bulk_upsert_dishes") as conn:
+            # NOT EXISTS не видит чужих незакоммиченных вставок: без лока два «Борща» в разном
+            # регистре из параллельных транзакций оба прошли бы проверку
+            await _run(conn, "lock_dishes", "fetch")
+            rows = await _run(conn, "insert_dishes", "fetch", list(uniq.values()))
+            if rows:
+                await _run(conn, "notify_dishes_added", "fetch", [r["name"] for r in rows])
+        for r in rows:
+            self._dish_changed("+", r["name"])
+        return len(rows), len(uniq) - len(rows)
+
+    async def delete_dish(self, name: str):
+        async with self.transaction("delete_dish") as conn:
+            await conn.execute("DELETE FROM dishes WHERE name=$1", name.strip())
+            await _run(conn, "notify", "fetch", "dishes", "-" + name.strip())
+        self._dish_changed("-", name.strip())
+
+    async def list_dishes(self) -> list[str]:
+        async with self.acquire("list_dishes") as conn:
+            rows = await conn.fetch("SELECT name FROM dishes")
+        return [r["name"] for r in rows]
+
+    async def count_dishes(self) -> int:
+        async with self.acquire("count_dishes") as conn:
+            return await conn.fetchval("SELECT COUNT(*) FROM dishes")
+
+    async def load_dish_index(self) -> None:
+        # /dadd, /ddel, /dbulk на других репликах приходят через NOTIFY dishes; LISTEN — до чтения
+        await self.listen("dishes", self._on_dish_notify, resync=self.reload_dish_index)
+        await self.reload_dish_index()
+
+    async def reload_dish_index(self) -> None:
         """
-        await self.pool.execute(q, feedback_id, chat_id, message_id)
+        Каталог целиком: индекс строится в потоке (100k названий — секунды CPU, event loop не стоит)
+        и подменяется разом. Изменения, пришедшие за время сборки, доигрываются поверх нового индекса.
+        """
+        self._dish_replay = []
+        try:
+            names = await self.list_dishes()
+            fresh = DishIndex()
+            await asyncio.to_thread(fresh.load, names)
+            for op, name in self._dish_replay:
+                if op == "+":
+                    fresh.add(name)
+                else:
+                    fresh.remove(name)
+            self.dishes.replace(fresh)
+        finally:
+            self._dish_replay = None
+
+    def _dish_changed(self, op: str, name: str) -> None:
+        if op == "+":
+            self.dishes.add(name)
+        else:
+            self.dishes.remove(name)
+        if self._dish_replay is not None:
+            self._dish_replay.append((op, name))
+
+    def _on_dish_notify(self, payload: str) -> None:
+        # "+название" / "-название"; своё же уведомление повторяет уже сделанное — безвредно
+        if payload[:1] in ("+", "-"):
+            self._dish_changed(payload[0], payload[1:])
+
+    async def create_feedback(self, feedback_date, dish_name: str, guest_comment: str, kitchen_reply: str | None):
+        async with self.transaction("create_feedback") as conn:
+            row = await _run(conn, "insert_feedback", "fetchrow", feedback_date, dish_name, guest_comment, kitchen_reply)
+            await self._bump_stats(conn, feedback_date, dish_name, 1, _has_reply(kitchen_reply))
+            events = [("sheets_append", sheet_payload(row))]
+            if kitchen_reply:
+                events.append(("group_publish", {}))
+            await self._enqueue(conn, row["id"], events)
+        return row["id"]
+
+    async def set_message_refs(self, feedback_id: int, chat_id: int, message_id: int):
+        await self._q("set_message_refs", "fetch", feedback_id, chat_id, message_id)
 
     async def get_feedback(self, feedback_id: int):
-        assert self.pool
-        return await self.pool.fetchrow("SELECT * FROM feedback WHERE id=$1", feedback_id)
+        return await self._q("get_feedback", "fetchrow", feedback_id)
 
     async def update_kitchen_reply(self, feedback_id: int, kitchen_reply: str):
-        assert self.pool
-        await self.pool.execute("UPDATE feedback SET kitchen_reply=$2 WHERE id=$1", feedback_id, kitchen_reply)
+        async with self.transaction("update_kitchen_reply") as conn:
+            row = await _run(conn, "update_kitchen_reply", "fetchrow", feedback_id, kitchen_reply)
+            if not row:
+                return None
+            delta = _has_reply(row["kitchen_reply"]) - _has_reply(row["old_reply"])
+            if delta:
+                await self._bump_stats(conn, row["feedback_date"], row["dish_name"], 0, delta)
+            events = [("sheets_update", sheet_payload(row))]
+            if kitchen_reply:
+                events.append(("group_publish", {}))
+            await self._enqueue(conn, feedback_id, events)
+        return row
 
-    async def set_group_message_refs(self, fid: int, chat_id: int, message_id: int):
-        await self.pool.execute(
-            "UPDATE feedback SET group_chat_id=$2, group_message_id=$3 WHERE id=$1",
-            fid, chat_id, message_id
-        )
+    async def set_group_message_refs(self, fid: int, chat_id: int, message_id: int) -> bool:
+        # False — записи уже нет: её удалили, пока сообщение отправлялось
+        return await self._q("set_group_message_refs", "fetchval", fid, chat_id, message_id) is not None
+
+    async def feedback_page(
+        self,
+        cursor: tuple[date, int],
+        bound: date,
+        dish: str | None,
+        limit: int,
+        newer: bool = False,
+    ) -> tuple[list[asyncpg.Record], bool]:
+        """
+        Страница журнала ОС от курсора (feedback_date, id): по умолчанию — более старые записи
+        (не раньше bound), newer=True — более новые (не позже bound).
+        Возвращает (строки от новых к старым, есть ли ещё записи в ту же сторону).
+        """
+        name = ("feedback_newer" if newer else "feedback_older") + ("_dish" if dish else "")
+        args = [cursor[0], cursor[1], bound, limit + 1] + ([dish] if dish else [])
+        rows = await self._q(name, "fetch", *args)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if newer:
+            rows.reverse()
+        return rows, more
+
+    # ---------- Stats ----------
+    async def _bump_stats(self, conn: asyncpg.Connection, day: date, dish_name: str, total: int, replied: int) -> None:
+        await _run(conn, "bump_daily_stats", "fetch", day, dish_name, total, replied)
+
+    async def dish_stats(self, date_from: date, date_to: date, prev_from: date):
+        """
+        По блюдам за [date_from, date_to] из сводки: записи, с ответом и записи за прошлый период
+        [prev_from, date_from) — для тренда.
+        """
+        async with self.acquire("dish_stats") as conn:
+            return await conn.fetch(
+                """
+                SELECT dish_name,
+                       COALESCE(SUM(total) FILTER (WHERE day >= $1), 0) AS total,
+                       COALESCE(SUM(replied) FILTER (WHERE day >= $1), 0) AS replied,
+                       COALESCE(SUM(total) FILTER (WHERE day < $1), 0) AS prev_total
+                FROM feedback_daily_stats
+                WHERE day BETWEEN $3 AND $2
+                GROUP BY dish_name
+                HAVING SUM(total) > 0
+                ORDER BY total DESC, dish_name
+                """,
+                date_from, date_to, prev_from,
+            )
 
-    async def set_group_message_refs(self, fid: int, chat_id: int, message_id: int) -> None:
-        await self.pool.execute(
-            "UPDATE feedback SET group_chat_id=$2, group_message_id=$3 WHERE id=$1",
-            fid, chat_id, message_id
+    async def daily_stats(self, date_from: date, date_to: date, dish: str | None = None):
+        async with self.acquire("daily_stats") as conn:
+            return await conn.fetch(
+                """
+                SELECT day, SUM(total) AS total, SUM(replied) AS replied
+                FROM feedback_daily_stats
+                WHERE day BETWEEN $1 AND $2 AND ($3::text IS NULL OR dish_name = $3)
+                GROUP BY day
+                ORDER BY day
+                """,
+                date_from, date_to, dish,
+            )
+
+    # ---------- Export ----------
+    async def copy_feedback_csv(self, date_from: date, date_to: date, output, timeout: float | None = None) -> int:
+        """
+        Записи за период в CSV прямо из Postgres (COPY ... TO STDOUT) в файл output — без Python-объектов на строку.
+        Возвращает число строк.
+        """
+        async with self.acquire("copy_feedback_csv") as conn:
+            status = await conn.copy_from_query(
+                """
+                SELECT id AS "ID",
+                       to_char(feedback_date, 'DD.MM.YYYY') AS "Дата",
+                       dish_name AS "Блюдо",
+                       guest_comment AS "Комментарий гостя",
+                       COALESCE(kitchen_reply, '') AS "Ответ кухни"
+                FROM feedback
+                WHERE feedback_date BETWEEN $1 AND $2
+                ORDER BY feedback_date, id
+                """,
+                date_from, date_to,
+                output=output, format="csv", header=True, timeout=timeout,
+            )
+        # "COPY 123"
+        return int(status.split()[-1])
+
+    async def iter_feedback(self, date_from: date, date_to: date, chunk: int = 5000, timeout: float | None = None):
+        """
+        Записи за период пачками по chunk через серверный курсор: память не растёт с размером выборки.
+        """
+        async with self.acquire("iter_feedback") as conn, conn.transaction():
+            cur = await conn.cursor(
+                """
+                SELECT id, feedback_date, dish_name, guest_comment, kitchen_reply
+                FROM feedback
+                WHERE feedback_date BETWEEN $1 AND $2
+                ORDER BY feedback_date, id
+                """,
+                date_from, date_to,
+            )
+            while True:
+                rows = await cur.fetch(chunk, timeout=timeout)
+                if not rows:
+                    return
+                yield rows
+
+    # ---------- Outbox ----------
+    async def _enqueue(self, conn: asyncpg.Connection, feedback_id: int, events: list[tuple[str, dict]]) -> None:
+        await _run(
+            conn, "enqueue_outbox", "executemany",
+            [(feedback_id, kind, json.dumps(payload, ensure_ascii=False)) for kind, payload in events],
         )
+        await _run(conn, "notify_outbox", "fetch")
+
+    async def claim_outbox(self, limit: int, lease: float) -> list[asyncpg.Record]:
+        return await self._q("claim_outbox", "fetch", limit, float(lease))
 
+    async def complete_outbox(self, ids: list[int]) -> None:
+        await self._q("complete_outbox", "fetch", ids)
+
+    async def retry_outbox(self, event_id: int, delay: float, error: str) -> None:
+        await self._q("retry_outbox", "fetch", event_id, float(delay), error)
+
+    async def dead_outbox(self, event_id: int, error: str) -> None:
+        await self._q("dead_outbox", "fetch", event_id, error)
+
+    async def count_dead_outbox(self) -> int:
+        async with self.acquire("count_dead_outbox") as conn:
+            return await conn.fetchval("SELECT COUNT(*) FROM outbox WHERE status='dead'")
+
+    # ---------- Persistence ----------
+    async def load_user_data(self) -> list[asyncpg.Record]:
+        async with self.acquire("load_user_data") as conn:
+            return await conn.fetch("SELECT user_id, data FROM bot_user_data")
+
+    async def load_conversations(self, name: str) -> list[asyncpg.Record]:
+        async with self.acquire("load_conversations") as conn:
+            return await conn.fetch("SELECT key, state FROM bot_conversations WHERE name=$1", name)
+
+    async def save_persistence(
+        self,
+        user_rows: list[tuple[int, bytes]],
+        user_deletes: list[int],
+        conv_rows: list[tuple[str, str, bytes]],
+        conv_deletes: list[tuple[str, str]],
+    ) -> None:
+        """
+        Все накопленные изменения persistence — одной транзакцией, по запросу на вид изменений.
+        """
+        async with self.transaction("save_persistence") as conn:
+            if user_rows:
+                await conn.executemany(
+                    """
+                    INSERT INTO bot_user_data(user_id, data) VALUES($1, $2)
+                    ON CONFLICT (user_id) DO UPDATE SET data=EXCLUDED.data, updated_at=NOW()
+                    """,
+                    user_rows,
+                )
+            if user_deletes:
+                await conn.execute("DELETE FROM bot_user_data WHERE user_id = ANY($1::bigint[])", user_deletes)
+            if conv_rows:
+                await conn.executemany(
+                    """
+                    INSERT INTO bot_conversations(name, key, state) VALUES($1, $2, $3)
+                    ON CONFLICT (name, key) DO UPDATE SET state=EXCLUDED.state, updated_at=NOW()
+                    """,
+                    conv_rows,
+                )
+            if conv_deletes:
+                await conn.executemany("DELETE FROM bot_conversations WHERE name=$1 AND key=$2", conv_deletes)
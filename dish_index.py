@@ -0,0 +1,178 @@
+import heapq
+
+
+def normalize(s: str) -> str:
+    """
+    Нормализация названия/запроса: регистр, ё→е, лишние пробелы.
+    """
+    s = " ".join((s or "").strip().split()).lower()
+    return s.replace("ё", "е")
+
+
+def _grams(s: str, n: int) -> set[str]:
+    return {s[i:i + n] for i in range(len(s) - n + 1)}
+
+
+# начала слов индексируются длиной 2..PREFIX_MAX: короткий запрос — готовое множество без проверок
+PREFIX_MAX = 4
+
+
+def _prefixes(norm: str) -> set[str]:
+    return {w[:n] for w in norm.split(" ") for n in range(2, min(len(w), PREFIX_MAX) + 1)}
+
+
+class DishIndex:
+    """
+    In-memory индекс блюд: n-граммы (2 и 3 символа) нормализованных названий → названия.
+    Поиск по подстрокам всех слов запроса без походов в БД.
+    Отдельно — начала слов: названия, где каждое слово запроса начинает слово, ранжируются выше всех
+    остальных, и если их хватает на limit, остальные кандидаты не ранжируются вовсе.
+    """
+
+    def __init__(self):
+        self._norm: dict[str, str] = {}  # name -> нормализованное name
+        self._postings: dict[str, set[str]] = {}  # n-грамма -> names
+        self._starts: dict[str, set[str]] = {}  # начало слова (2..PREFIX_MAX) -> names
+        self._heads: dict[str, set[str]] = {}  # начало всего названия (2..PREFIX_MAX) -> names
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._norm)
+
+    def __contains__(self, name: str) -> bool:
+        return name.strip() in self._norm
+
+    def __iter__(self):
+        return iter(self._norm)
+
+    def load(self, names) -> None:
+        self._norm.clear()
+        self._postings.clear()
+        self._starts.clear()
+        self._heads.clear()
+        for name in names:
+            self.add(name)
+        self.loaded = True
+
+    def replace(self, other: "DishIndex") -> None:
+        # подмена целиком: большой каталог строится в потоке в отдельном индексе (см. DB.load_dish_index),
+        # а поиск на event loop видит либо старый индекс, либо новый — никогда наполовину заполненный
+        self._norm, self._postings = other._norm, other._postings
+        self._starts, self._heads = other._starts, other._heads
+        self.loaded = other.loaded
+
+    def add(self, name: str) -> None:
+        name = name.strip()
+        if not name or name in self._norm:
+            return
+        norm = normalize(name)
+        self._norm[name] = norm
+        for g in _grams(norm, 2) | _grams(norm, 3):
+            self._postings.setdefault(g, set()).add(name)
+        for p in _prefixes(norm):
+            self._starts.setdefault(p, set()).add(name)
+        for n in range(2, min(len(norm), PREFIX_MAX) + 1):
+            self._heads.setdefault(norm[:n], set()).add(name)
+
+    def remove(self, name: str) -> None:
+        name = name.strip()
+        norm = self._norm.pop(name, None)
+        if norm is None:
+            return
+        for g in _grams(norm, 2) | _grams(norm, 3):
+            posting = self._postings.get(g)
+            if posting is None:
+                continue
+            posting.discard(name)
+            if not posting:
+                del self._postings[g]
+        for p in _prefixes(norm):
+            posting = self._starts.get(p)
+            if posting is None:
+                continue
+            posting.discard(name)
+            if not posting:
+                del self._starts[p]
+        for n in range(2, min(len(norm), PREFIX_MAX) + 1):
+            posting = self._heads.get(norm[:n])
+            if posting is None:
+                continue
+            posting.discard(name)
+            if not posting:
+                del self._heads[norm[:n]]
+
+    def _candidates(self, token: str) -> set[str]:
+        if len(token) < 2:
+            return {name for name, norm in self._norm.items() if token in norm}
+
+        n = 3 if len(token) >= 3 else 2
+        # начинаем с самой редкой n-граммы — пересечения остаются маленькими
+        postings = sorted((self._postings.get(g, set()) for g in _grams(token, n)), key=len)
+        if not postings[0]:
+            return set()
+        found = set(postings[0])
+        for posting in postings[1:]:
+            found &= posting
+            if not found:
+                return found
+        # n-граммы не гарантируют подстроку целиком — добиваем проверкой
+        return {name for name in found if token in self._norm[name]}
+
+    def _word_starts(self, tokens: list[str]) -> set[str]:
+        # названия, где каждый токен — начало какого-то слова
+        postings = sorted((self._starts.get(t[:PREFIX_MAX], set()) for t in tokens), key=len)
+        found = set(postings[0])
+        for posting in postings[1:]:
+            found &= posting
+            if not found:
+                return found
+        long = [t for t in tokens if len(t) > PREFIX_MAX]
+        if long:
+            found = {
+                name for name in found
+                if all(any(w.startswith(t) for w in self._norm[name].split(" ")) for t in long)
+            }
+        return found
+
+    def _match(self, tokens: list[str]) -> set[str]:
+        found: set[str] | None = None
+        for token in sorted(tokens, key=len, reverse=True):
+            cand = self._candidates(token)
+            found = cand if found is None else found & cand
+            if not found:
+                return set()
+        return found or set()
+
+    def _rank(self, name: str, q: str, tokens: list[str]):
+        norm = self._norm[name]
+        words = norm.split(" ")
+        word_starts = sum(1 for t in tokens if any(w.startswith(t) for w in words))
+        return (norm != q, not norm.startswith(q), -word_starts, len(norm), name)
+
+    def search(self, query: str, limit: int = 10) -> list[str]:
+        q = normalize(query)
+        if len(q) < 2:
+            return []
+
+        tokens = list(dict.fromkeys(p for p in q.split(" ") if len(p) >= 2)) or q.split(" ")
+        if all(len(t) >= 2 for t in tokens):
+            best = self._word_starts(tokens)
+            if len(best) >= limit:
+                # у всех best word_starts одинаковый (= len(tokens)) — ключ без разбора слов;
+                # названия, начинающиеся с запроса, идут первыми — хватит их, остальные не смотрим
+                norm = self._norm
+                heads = self._heads.get(q[:PREFIX_MAX], set())
+                if len(q) > PREFIX_MAX:
+                    heads = {name for name in heads if norm[name].startswith(q)}
+                if len(heads) >= limit:
+                    return heapq.nsmallest(limit, heads, key=lambda name: (norm[name] != q, len(norm[name]), name))
+                return heapq.nsmallest(
+                    limit, best, key=lambda name: (norm[name] != q, not norm[name].startswith(q), len(norm[name]), name)
+                )
+
+        found = self._match(tokens)
+        if not found and len(tokens) > 1:
+            # как раньше: если по всем словам пусто — ищем по первому
+            found = self._match(tokens[:1])
+
+        return heapq.nsmallest(limit, found, key=lambda name: self._rank(name, q, tokens))
@@ -0,0 +1,53 @@
+import os
+import asyncio
+from datetime import date
+
+from db import DB
+
+# Потолок документа, который бот может отправить через Bot API
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+
+_HEADER = ["ID", "Дата", "Блюдо", "Комментарий гостя", "Ответ кухни"]
+
+
+async def write_csv(db: DB, date_from: date, date_to: date, path: str, timeout: float | None = None) -> int:
+    """
+    CSV через COPY TO STDOUT: Postgres сам кодирует строки, asyncpg пишет их в файл по мере прихода.
+    BOM в начале — чтобы Excel открыл кириллицу без танцев с кодировкой.
+    """
+    with open(path, "wb") as f:
+        f.write(b"\xef\xbb\xbf")
+        return await db.copy_feedback_csv(date_from, date_to, f, timeout=timeout)
+
+
+async def write_xlsx(db: DB, date_from: date, date_to: date, path: str, timeout: float | None = None) -> int:
+    """
+    XLSX через серверный курсор и write-only книгу openpyxl (строки сразу уходят во временный файл).
+    Кодирование пачки — в потоке, чтобы не держать event loop. Нужен openpyxl (ImportError, если нет).
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Feedback")
+    ws.append(_HEADER)
+
+    def append_rows(rows) -> None:
+        for r in rows:
+            ws.append([r["id"], r["feedback_date"], r["dish_name"], r["guest_comment"], r["kitchen_reply"] or ""])
+
+    n = 0
+    async for rows in db.iter_feedback(date_from, date_to, timeout=timeout):
+        await asyncio.to_thread(append_rows, rows)
+        n += len(rows)
+    await asyncio.to_thread(wb.save, path)
+    return n
+
+
+def file_name(date_from: date, date_to: date, fmt: str) -> str:
+    if date_from == date.min and date_to == date.max:
+        return f"feedback_all.{fmt}"
+    return f"feedback_{date_from.isoformat()}_{date_to.isoformat()}.{fmt}"
+
+
+def too_big(path: str) -> bool:
+    return os.path.getsize(path) > MAX_DOCUMENT_BYTES
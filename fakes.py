@@ -0,0 +1,491 @@
+import re
+import json
+import time
+import asyncio
+import itertools
+from datetime import date
+
+from telegram.request import BaseRequest, RequestData
+
+from dish_index import DishIndex, normalize, _grams
+
+# Подставные реализации внешних сервисов для офлайн-бенчмарков и нагрузочных прогонов.
+# Повторяют ровно то подмножество API, которым пользуются sheets.py / main.py.
+
+
+def _row_range(rng: str) -> tuple[int, int]:
+    # "A15" / "A15:E15" / "Sheet1!A15:E15" -> (15, 15)
+    nums = [int(x) for x in re.findall(r"[A-Z]+(\d+)", rng.split("!")[-1])]
+    return nums[0], nums[-1]
+
+
+class FakeSpreadsheet:
+    def __init__(self, ws: "FakeWorksheet"):
+        self._ws = ws
+
+    def batch_update(self, body: dict) -> dict:
+        for req in body.get("requests", []):
+            rng = req["deleteDimension"]["range"]
+            del self._ws.rows[rng["startIndex"]:rng["endIndex"]]
+            self._ws.calls += 1
+        return {}
+
+
+class FakeWorksheet:
+    """
+    Лист в памяти вместо gspread.Worksheet. rows[0] — строка 1 (заголовок).
+    calls — сколько раз сходили «в API» (для сравнения пакетной и поштучной записи).
+    latency — искусственная задержка каждого вызова (секунды), для нагрузочных прогонов.
+    """
+
+    id = 0
+    title = "Sheet1"
+
+    def __init__(self, rows: list[list[str]] | None = None, latency: float = 0.0):
+        self.rows: list[list[str]] = rows if rows is not None else [["ID", "Дата", "Блюдо", "Комментарий", "Ответ"]]
+        self.latency = latency
+        self.calls = 0
+        self.spreadsheet = FakeSpreadsheet(self)
+
+    @classmethod
+    def with_ids(cls, n: int, **kwargs) -> "FakeWorksheet":
+        ws = cls(**kwargs)
+        ws.rows.extend([str(i), "01/01/26", f"Блюдо {i}", "комментарий", ""] for i in range(1, n + 1))
+        return ws
+
+    def ids(self) -> list[str]:
+        # столбец A без заголовка
+        return [r[0] if r else "" for r in self.rows[1:]]
+
+    def _hit(self) -> None:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def col_values(self, col: int) -> list[str]:
+        self._hit()
+        return [r[col - 1] if len(r) >= col else "" for r in self.rows]
+
+    def get_all_values(self) -> list[list[str]]:
+        self._hit()
+        return [list(r) for r in self.rows]
+
+    def batch_get(self, ranges: list[str]) -> list[list[list[str]]]:
+        self._hit()
+        out = []
+        for rng in ranges:
+            start, end = _row_range(rng)
+            out.append([list(r[:1]) for r in self.rows[start - 1:end]])
+        return out
+
+    @staticmethod
+    def _parse(c: str) -> str:
+        # как Sheets разбирает ввод USER_ENTERED (только то, что важно для тестов):
+        # ведущий апостроф — «это текст» и в значение не попадает, остальное может стать формулой, числом, датой
+        if c.startswith("'"):
+            return c[1:]
+        if c.startswith("="):
+            return "#NAME?"
+        if re.fullmatch(r"\+\d+", c):
+            return c[1:]
+        if re.fullmatch(r"\d{1,2}/\d{1,2}", c):
+            return f"{c}/2026"
+        return c
+
+    def _cells(self, row: list, value_input_option: str) -> list[str]:
+        cells = [str(v) for v in row]
+        if value_input_option == "USER_ENTERED":
+            cells = [self._parse(c) for c in cells]
+        return cells
+
+    def _append(self, values: list[list], value_input_option: str) -> dict:
+        start = len(self.rows) + 1
+        self.rows.extend(self._cells(row, value_input_option) for row in values)
+        return {"updates": {"updatedRange": f"{self.title}!A{start}:E{len(self.rows)}"}}
+
+    def append_row(self, values: list, value_input_option: str = "RAW") -> dict:
+        self._hit()
+        return self._append([values], value_input_option)
+
+    def append_rows(self, values: list[list], value_input_option: str = "RAW") -> dict:
+        self._hit()
+        return self._append(values, value_input_option)
+
+    def _write(self, rng: str, values: list[list], value_input_option: str) -> None:
+        start, _ = _row_range(rng)
+        for i, row in enumerate(values):
+            idx = start - 1 + i
+            while len(self.rows) <= idx:
+                self.rows.append([])
+            self.rows[idx] = self._cells(row, value_input_option)
+
+    def update(self, rng: str, values: list[list], value_input_option: str = "RAW") -> dict:
+        self._hit()
+        self._write(rng, values, value_input_option)
+        return {}
+
+    def batch_update(self, data: list[dict], value_input_option: str = "RAW") -> dict:
+        self._hit()
+        for item in data:
+            self._write(item["range"], item["values"], value_input_option)
+        return {}
+
+    def delete_rows(self, start: int, end: int | None = None) -> dict:
+        self._hit()
+        del self.rows[start - 1:(end or start)]
+        return {}
+
+
+class FakeDishDB:
+    """
+    Заглушка DB для поиска блюд: индекс в памяти + search_dishes «как pg_trgm»
+    (линейный проход по похожести триграмм — та же асимптотика, что у запасного запроса без индекса).
+    """
+
+    def __init__(self, names: list[str]):
+        self.dishes = DishIndex()
+        self.dishes.load(names)
+        self._names = [(n, _grams(normalize(n), 3)) for n in names]
+
+    async def search_dishes(self, query: str, limit: int = 10) -> list[str]:
+        q = _grams(normalize(query), 3)
+        if not q:
+            return []
+        scored = [(len(q & g) / len(q), n) for n, g in self._names]
+        scored = [x for x in scored if x[0] >= 0.6]
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [n for _, n in scored[:limit]]
+
+
+class FakeDB(FakeDishDB):
+    """
+    DB целиком в памяти — для нагрузочных прогонов без Postgres.
+    Каждый вызов занимает «соединение» (семафор на pool_size) на latency секунд,
+    так что размер пула и задержка БД влияют на результат так же, как в жизни.
+    Outbox настоящий по смыслу: события копятся и будят воркер через listen().
+    """
+
+    def __init__(self, names: list[str], latency: float = 0.0, pool_size: int = 5):
+        super().__init__(names)
+        self.latency = latency
+        self.pool_size = pool_size
+        self._sem = asyncio.Semaphore(pool_size)
+        self._ids = itertools.count(1)
+        self._outbox_ids = itertools.count(1)
+        self.feedback: dict[int, dict] = {}
+        self.subscribers: dict[int, str] = {}
+        self.outbox: dict[int, dict] = {}
+        self._leased: set[int] = set()
+        self._listeners: dict[str, list] = {}
+        self.admins: dict[int, str] = {}
+        self.user_data: dict[int, bytes] = {}
+        self.conversations: dict[tuple[str, str], bytes] = {}
+        self._norms = {normalize(n) for n in names}
+        self.acquired = 0
+
+    async def _roundtrip(self) -> None:
+        async with self._sem:
+            self.acquired += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+    def pool_stats(self) -> dict:
+        in_use = self.pool_size - self._sem._value
+        return {
+            "size": self.pool_size, "idle": self.pool_size - in_use, "in_use": in_use,
+            "min_size": self.pool_size, "max_size": self.pool_size,
+            "acquired": self.acquired, "wait_total_seconds": 0.0, "wait_avg_ms": 0.0, "wait_max_ms": 0.0,
+            "saturated": 0, "timeouts": 0, "listen_reconnects": 0,
+        }
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def listen(self, channel: str, callback, resync=None) -> None:
+        self._listeners.setdefault(channel, []).append(callback)
+
+    def _notify(self, channel: str) -> None:
+        for cb in self._listeners.get(channel, []):
+            cb("")
+
+    async def load_dish_index(self) -> None:
+        pass
+
+    async def search_dishes(self, query: str, limit: int = 10) -> list[str]:
+        await self._roundtrip()
+        return await super().search_dishes(query, limit)
+
+    async def upsert_dish(self, name: str) -> bool:
+        await self._roundtrip()
+        name = " ".join(name.split())
+        if normalize(name) in self._norms:
+            return False
+        self._norms.add(normalize(name))
+        self._names.append((name, _grams(normalize(name), 3)))
+        self.dishes.add(name)
+        return True
+
+    async def count_dishes(self) -> int:
+        await self._roundtrip()
+        return len(self.dishes)
+
+    # ---------- feedback ----------
+    def _enqueue(self, fid: int, events: list[tuple[str, dict]]) -> None:
+        for kind, payload in events:
+            eid = next(self._outbox_ids)
+            self.outbox[eid] = {
+                "id": eid, "feedback_id": fid, "kind": kind,
+                "payload": json.dumps(payload, ensure_ascii=False), "attempts": 0, "status": "pending",
+            }
+        self._notify("outbox")
+
+    @staticmethod
+    def _payload(row: dict) -> dict:
+        return {
+            "date": row["feedback_date"].strftime("%d/%m/%y"),
+            "dish": row["dish_name"],
+            "comment": row["guest_comment"],
+            "reply": row["kitchen_reply"] or "",
+        }
+
+    async def create_feedback(self, feedback_date: date, dish_name: str, guest_comment: str, kitchen_reply: str | None):
+        await self._roundtrip()
+        fid = next(self._ids)
+        row = self.feedback[fid] = {
+            "id": fid, "feedback_date": feedback_date, "dish_name": dish_name,
+            "guest_comment": guest_comment, "kitchen_reply": kitchen_reply,
+            "telegram_chat_id": None, "telegram_message_id": None,
+            "group_chat_id": None, "group_message_id": None,
+        }
+        events = [("sheets_append", self._payload(row))]
+        if kitchen_reply:
+            events.append(("group_publish", {}))
+        self._enqueue(fid, events)
+        return fid
+
+    async def set_message_refs(self, feedback_id: int, chat_id: int, message_id: int):
+        await self._roundtrip()
+        if feedback_id in self.feedback:
+            self.feedback[feedback_id].update(telegram_chat_id=chat_id, telegram_message_id=message_id)
+
+    async def get_feedback(self, feedback_id: int):
+        await self._roundtrip()
+        row = self.feedback.get(feedback_id)
+        return dict(row) if row else None
+
+    async def iter_feedback(self, date_from: date, date_to: date, chunk: int = 5000, timeout: float | None = None):
+        await self._roundtrip()
+        rows = sorted(
+            (dict(r) for r in self.feedback.values() if date_from <= r["feedback_date"] <= date_to),
+            key=lambda r: (r["feedback_date"], r["id"]),
+        )
+        for i in range(0, len(rows), chunk):
+            yield rows[i:i + chunk]
+
+    async def update_kitchen_reply(self, feedback_id: int, kitchen_reply: str):
+        await self._roundtrip()
+        row = self.feedback.get(feedback_id)
+        if not row:
+            return None
+        row["kitchen_reply"] = kitchen_reply
+        self._enqueue(feedback_id, [("sheets_update", self._payload(row)), ("group_publish", {})])
+        return dict(row)
+
+    async def set_group_message_refs(self, fid: int, chat_id: int, message_id: int) -> bool:
+        await self._roundtrip()
+        if fid not in self.feedback:
+            return False
+        self.feedback[fid].update(group_chat_id=chat_id, group_message_id=message_id)
+        return True
+
+    async def feedback_page(self, cursor, bound, dish, limit: int, newer: bool = False):
+        await self._roundtrip()
+        rows = [r for r in self.feedback.values() if not dish or r["dish_name"] == dish]
+        if newer:
+            rows = sorted(
+                (r for r in rows if (r["feedback_date"], r["id"]) > tuple(cursor) and r["feedback_date"] <= bound),
+                key=lambda r: (r["feedback_date"], r["id"]),
+            )
+        else:
+            rows = sorted(
+                (r for r in rows if (r["feedback_date"], r["id"]) < tuple(cursor) and r["feedback_date"] >= bound),
+                key=lambda r: (r["feedback_date"], r["id"]),
+                reverse=True,
+            )
+        more = len(rows) > limit
+        rows = [dict(r) for r in rows[:limit]]
+        if newer:
+            rows.reverse()
+        return rows, more
+
+    async def delete_feedback(self, fid: int) -> None:
+        await self._roundtrip()
+        row = self.feedback.pop(fid, None)
+        if row:
+            events = [("sheets_delete", {})]
+            if row["group_chat_id"] and row["group_message_id"]:
+                events.append(("group_delete", {"chat_id": row["group_chat_id"], "message_id": row["group_message_id"]}))
+            self._enqueue(fid, events)
+
+    # ---------- subscribers / broadcast ----------
+    async def upsert_subscriber(self, chat_id: int, chat_type: str = "private") -> None:
+        await self._roundtrip()
+        self.subscribers[chat_id] = chat_type
+
+    async def remove_subscriber(self, chat_id: int) -> None:
+        await self._roundtrip()
+        self.subscribers.pop(chat_id, None)
+
+    async def load_subscribers(self) -> None:
+        pass
+
+    async def count_subscribers(self) -> int:
+        await self._roundtrip()
+        return len(self.subscribers)
+
+    async def record_deliveries(
+        self, job_id: int, results, last_chat_id: int, dead: list[int] | None = None, owner: str | None = None
+    ) -> bool:
+        await self._roundtrip()
+        for cid in dead or ():
+            self.subscribers.pop(cid, None)
+        return True
+
+    async def claim_broadcast_jobs(self, owner: str, lease: float):
+        return []
+
+    # ---------- admins ----------
+    async def list_admins(self) -> dict[int, str]:
+        await self._roundtrip()
+        return dict(self.admins)
+
+    async def seed_admins(self, user_ids: set[int]) -> int:
+        await self._roundtrip()
+        added = [] if self.admins else list(user_ids)
+        self.admins.update((uid, "owner") for uid in added)
+        if added:
+            self._notify("admins")
+        return len(added)
+
+    async def set_admin(self, user_id: int, role: str, added_by: int | None = None) -> None:
+        await self._roundtrip()
+        self.admins[user_id] = role
+        self._notify("admins")
+
+    async def remove_admin(self, user_id: int) -> bool:
+        await self._roundtrip()
+        if self.admins.pop(user_id, None) is None:
+            return False
+        self._notify("admins")
+        return True
+
+    # ---------- outbox ----------
+    async def claim_outbox(self, limit: int, lease: float):
+        await self._roundtrip()
+        # голова очереди — по (feedback_id, канал), мёртвые не в счёт
+        heads: dict[tuple[int, str], dict] = {}
+        for ev in self.outbox.values():
+            if ev["status"] == "pending":
+                heads.setdefault((ev["feedback_id"], ev["kind"].split("_")[0]), ev)
+        claimed = [ev for ev in heads.values() if ev["id"] not in self._leased][:limit]
+        self._leased.update(ev["id"] for ev in claimed)
+        return [dict(ev) for ev in claimed]
+
+    async def complete_outbox(self, ids: list[int]) -> None:
+        await self._roundtrip()
+        for eid in ids:
+            self.outbox.pop(eid, None)
+            self._leased.discard(eid)
+
+    async def retry_outbox(self, event_id: int, delay: float, error: str) -> None:
+        await self._roundtrip()
+        ev = self.outbox.get(event_id)
+        if ev:
+            ev["attempts"] += 1
+        # аренда снимается после паузы, как next_attempt_at в Postgres
+        asyncio.get_running_loop().call_later(delay, self._leased.discard, event_id)
+
+    async def dead_outbox(self, event_id: int, error: str) -> None:
+        await self._roundtrip()
+        ev = self.outbox.get(event_id)
+        if ev:
+            ev.update(status="dead", attempts=ev["attempts"] + 1, last_error=error)
+        self._leased.discard(event_id)
+
+    async def count_dead_outbox(self) -> int:
+        await self._roundtrip()
+        return sum(1 for ev in self.outbox.values() if ev["status"] == "dead")
+
+    # ---------- persistence ----------
+    async def load_user_data(self):
+        return [{"user_id": uid, "data": blob} for uid, blob in self.user_data.items()]
+
+    async def load_conversations(self, name: str):
+        return [{"key": k, "state": blob} for (n, k), blob in self.conversations.items() if n == name]
+
+    async def save_persistence(self, user_rows, user_deletes, conv_rows, conv_deletes) -> None:
+        await self._roundtrip()
+        for uid, blob in user_rows:
+            self.user_data[uid] = blob
+        for uid in user_deletes:
+            self.user_data.pop(uid, None)
+        for name, key, blob in conv_rows:
+            self.conversations[(name, key)] = blob
+        for k in conv_deletes:
+            self.conversations.pop(tuple(k), None)
+
+
+class FakeBotRequest(BaseRequest):
+    """
+    Bot API в памяти: отвечает на вызовы PTB без сети, с задержкой latency на каждый вызов.
+    Запоминает последнее сообщение с inline-кнопками в каждом чате — чтобы «нажать» их (edit:<id>).
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: dict[str, int] = {}
+        self._message_ids = itertools.count(1_000_000)
+        self.last_inline: dict[int, dict] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _message(self, params: dict, message_id: int | None = None) -> dict:
+        chat_id = int(params["chat_id"])
+        msg = {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"},
+            "text": params.get("text", ""),
+        }
+        markup = params.get("reply_markup")
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        if isinstance(markup, dict) and "inline_keyboard" in markup:
+            msg["reply_markup"] = markup
+            self.last_inline[chat_id] = msg
+        return msg
+
+    def _result(self, api: str, params: dict):
+        if api == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        if api == "sendMessage":
+            return self._message(params)
+        if api == "editMessageText":
+            return self._message(params, int(params["message_id"]))
+        return True
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None, *args, **kwargs):
+        api = url.rsplit("/", 1)[-1]
+        self.calls[api] = self.calls.get(api, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data else {}
+        return 200, json.dumps({"ok": True, "result": self._result(api, params)}).encode()
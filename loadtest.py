@@ -0,0 +1,316 @@
+"""
+Нагрузочный прогон настоящего Application (new_conv/edit_conv) без Telegram и Google:
+Bot API и лист Sheets — подставные (fakes.py), БД — локальный Postgres (--dsn) или FakeDB в памяти.
+Апдейты идут через app.update_processor.process_update — как из polling/webhook,
+с теми же блокировками по чату и лимитом параллельности.
+
+    python loadtest.py --waiters 200 --rate 20                  # синтетика: 200 официантов, 20 новых/с
+    python loadtest.py --waiters 50 --rounds 3 --tg-latency 0.08 --db-latency 0.005 --pool-size 3
+    python loadtest.py --dsn postgresql://localhost/resto_test  # реальный пул asyncpg (тестовая база!)
+    python loadtest.py --replay updates.jsonl --rate 50         # записанный поток апдейтов (JSON на строку)
+
+Отчёт: p50/p95/p99 по каждому шагу диалога и общая пропускная способность (JSON — --out).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+import statistics
+
+from telegram import Update
+from telegram.ext import Application
+
+import main as bot
+import sheets
+from bench import catalog
+from fakes import FakeBotRequest, FakeDB, FakeWorksheet
+
+TOKEN = "123456:LOADTEST"
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.failed_updates: set[int] = set()
+        self.step_of: dict[int, str] = {}
+
+    def add(self, step: str, seconds: float) -> None:
+        self.samples.setdefault(step, []).append(seconds)
+
+
+def _pct(values: list[float], p: float) -> float:
+    # nearest-rank
+    k = max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[k]
+
+
+def summarize(rec: Recorder, wall: float) -> dict:
+    steps = {}
+    errors: dict[str, int] = {}
+    for uid in rec.failed_updates:
+        step = rec.step_of.get(uid, "?")
+        errors[step] = errors.get(step, 0) + 1
+    total = 0
+    for step, xs in rec.samples.items():
+        xs = sorted(xs)
+        total += len(xs)
+        steps[step] = {
+            "count": len(xs),
+            "errors": errors.get(step, 0),
+            "p50_ms": _pct(xs, 50) * 1000,
+            "p95_ms": _pct(xs, 95) * 1000,
+            "p99_ms": _pct(xs, 99) * 1000,
+            "max_ms": xs[-1] * 1000,
+            "mean_ms": statistics.fmean(xs) * 1000,
+        }
+    return {
+        "wall_seconds": wall,
+        "updates": total,
+        "updates_per_second": total / wall if wall else 0.0,
+        "errors": sum(errors.values()),
+        "steps": steps,
+    }
+
+
+class Driver:
+    """
+    Строит апдейты (как их прислал бы Telegram) и прогоняет их через процессор приложения.
+    """
+
+    def __init__(self, app: Application, tg: FakeBotRequest, rec: Recorder):
+        self.app = app
+        self.tg = tg
+        self.rec = rec
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def _user(uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": f"Waiter{uid}"}
+
+    def message(self, uid: int, text: str) -> dict:
+        msg = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"},
+            "from": self._user(uid),
+            "text": text,
+        }
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self._update_ids), "message": msg}
+
+    def callback(self, uid: int, data: str, message: dict) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": self._user(uid),
+                "chat_instance": str(uid),
+                "data": data,
+                "message": message,
+            },
+        }
+
+    async def feed(self, step: str, data: dict) -> None:
+        update = Update.de_json(data, self.app.bot)
+        self.rec.step_of[update.update_id] = step
+        t0 = time.perf_counter()
+        await self.app.update_processor.process_update(update, self.app.process_update(update))
+        self.rec.add(step, time.perf_counter() - t0)
+
+    def inline_button(self, uid: int, prefix: str) -> tuple[str, dict] | None:
+        msg = self.tg.last_inline.get(uid)
+        if not msg:
+            return None
+        for row in msg["reply_markup"]["inline_keyboard"]:
+            for btn in row:
+                if str(btn.get("callback_data", "")).startswith(prefix):
+                    return btn["callback_data"], msg
+        return None
+
+
+def pick_dishes(db, limit: int = 500) -> list[str]:
+    """
+    Блюда, которые поиск находит однозначно (один точный вариант) — шаг «блюдо» проходит за одно сообщение.
+    """
+    out = []
+    names = list(db.dishes)
+    random.Random(5).shuffle(names)
+    for name in names:
+        if db.dishes.search(name, limit=2) == [name]:
+            out.append(name)
+            if len(out) >= limit:
+                break
+    return out
+
+
+async def waiter(drv: Driver, uid: int, dishes: list[str], rounds: int, think: float, skip_ratio: float) -> None:
+    rnd = random.Random(uid)
+
+    async def pause():
+        if think:
+            await asyncio.sleep(rnd.expovariate(1 / think))
+
+    await drv.feed("start", drv.message(uid, "/start"))
+    for _ in range(rounds):
+        await pause()
+        # как живой официант: «➕ Новая запись» из приветствия/последней карточки, иначе /new
+        button = drv.inline_button(uid, "new")
+        if button is not None:
+            await drv.feed("new", drv.callback(uid, *button))
+        else:
+            await drv.feed("new", drv.message(uid, "/new"))
+        await pause()
+        if dishes:
+            await drv.feed("dish", drv.message(uid, rnd.choice(dishes)))
+        else:
+            await drv.feed("dish", drv.message(uid, f"Новое блюдо {uid}"))
+            await drv.feed("dish_confirm_new", drv.message(uid, "➕ Добавить как новое"))
+        await pause()
+        await drv.feed("comment", drv.message(uid, "Гость говорит: пересолено"))
+        await pause()
+        if rnd.random() < skip_ratio:
+            await drv.feed("skip", drv.message(uid, "/skip"))
+        else:
+            await drv.feed("reply", drv.message(uid, "Повар в курсе, исправим"))
+
+        button = drv.inline_button(uid, "edit:")
+        if button is None:
+            continue
+        await pause()
+        await drv.feed("edit", drv.callback(uid, *button))
+        await pause()
+        await drv.feed("edit_reply", drv.message(uid, "Заменили блюдо, извинились"))
+
+
+def _replay_step(data: dict) -> str:
+    if "callback_query" in data:
+        return "cb:" + str(data["callback_query"].get("data", "")).split(":", 1)[0]
+    text = (data.get("message") or {}).get("text") or ""
+    return text.split()[0] if text.startswith("/") else "text"
+
+
+async def replay(drv: Driver, path: str, rate: float) -> None:
+    tasks = []
+    t0 = time.perf_counter()
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(ln for ln in f if ln.strip()):
+            if rate:
+                delay = t0 + i / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            data = json.loads(line)
+            tasks.append(asyncio.create_task(drv.feed(_replay_step(data), data)))
+    await asyncio.gather(*tasks)
+
+
+async def run(args) -> dict:
+    tg = FakeBotRequest(latency=args.tg_latency)
+    if args.dsn:
+        from db import DB
+        db = DB(args.dsn)
+    else:
+        db = FakeDB(catalog(args.dishes), latency=args.db_latency, pool_size=args.pool_size)
+
+    # лист Sheets в памяти: _ws() вернёт его вместо похода в Google
+    ws = FakeWorksheet(latency=args.sheets_latency)
+    sheets._worksheet = ws
+    sheets._rows = None
+
+    app = bot.build_app(db, token=TOKEN, request=tg)
+    rec = Recorder()
+
+    async def on_error(update, context):
+        if isinstance(update, Update):
+            rec.failed_updates.add(update.update_id)
+        print(f"[loadtest] ERROR: {context.error!r}", file=sys.stderr)
+
+    app.add_error_handler(on_error)
+
+    await app.initialize()
+    await bot.on_startup(app)
+    await app.start()
+    drv = Driver(app, tg, rec)
+    try:
+        t0 = time.perf_counter()
+        if args.replay:
+            await replay(drv, args.replay, args.rate)
+        else:
+            dishes = pick_dishes(db)
+            tasks = []
+            for i in range(args.waiters):
+                if args.rate:
+                    delay = t0 + i / args.rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                uid = 10_000 + i
+                tasks.append(asyncio.create_task(
+                    waiter(drv, uid, dishes, args.rounds, args.think, args.skip_ratio)
+                ))
+            await asyncio.gather(*tasks)
+        wall = time.perf_counter() - t0
+
+        # дожидаемся фоновой записи в Sheets, чтобы посчитать вызовы честно
+        await app.bot_data["sheets"].flush()
+    finally:
+        # порядок как в run_polling: shutdown (финальная запись persistence идёт через БД),
+        # и только потом post_shutdown — он закрывает БД и останавливает writer
+        await app.stop()
+        await app.shutdown()
+        await bot.on_shutdown(app)
+
+    report = summarize(rec, wall)
+    report["config"] = {k: v for k, v in vars(args).items() if k != "dsn"}
+    report["bot_api_calls"] = tg.calls
+    report["sheets_api_calls"] = ws.calls
+    return report
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="End-to-end load test with fake Bot API and Sheets")
+    ap.add_argument("--waiters", type=int, default=100, help="simulated users (one private chat each)")
+    ap.add_argument("--rate", type=float, default=10.0, help="new waiters (or replayed updates) per second, 0 = all at once")
+    ap.add_argument("--rounds", type=int, default=1, help="feedback records per waiter")
+    ap.add_argument("--think", type=float, default=0.0, help="mean pause between steps, seconds")
+    ap.add_argument("--skip-ratio", type=float, default=0.3, help="share of records saved with /skip")
+    ap.add_argument("--replay", help="JSONL file with recorded Telegram updates instead of synthetic waiters")
+    ap.add_argument("--dsn", help="real Postgres (test database!) instead of the in-memory FakeDB")
+    ap.add_argument("--dishes", type=int, default=1000, help="dish catalog size for FakeDB")
+    ap.add_argument("--pool-size", type=int, default=int(os.getenv("DB_POOL_MAX", "5")), help="FakeDB connections")
+    ap.add_argument("--db-latency", type=float, default=0.002, help="FakeDB round trip, seconds")
+    ap.add_argument("--tg-latency", type=float, default=0.05, help="Bot API round trip, seconds")
+    ap.add_argument("--sheets-latency", type=float, default=0.3, help="Sheets API call, seconds")
+    ap.add_argument("--out", help="write JSON report here")
+    args = ap.parse_args()
+
+    report = asyncio.run(run(args))
+
+    print(f"{'step':<18} {'count':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}", file=sys.stderr)
+    for step, s in report["steps"].items():
+        print(
+            f"{step:<18} {s['count']:>6} {s['errors']:>4} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} "
+            f"{s['p99_ms']:>9.1f} {s['max_ms']:>9.1f}",
+            file=sys.stderr,
+        )
+    print(
+        f"updates: {report['updates']} in {report['wall_seconds']:.1f}s "
+        f"({report['updates_per_second']:.1f}/s), errors: {report['errors']}, "
+        f"sheets calls: {report['sheets_api_calls']}",
+        file=sys.stderr,
+    )
+
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,14 @@
 import os
 import asyncio
-from datetime import datetime
+import re
+import socket
+import secrets
+import tempfile
+from datetime import date, datetime, timedelta
 
 from dotenv import load_dotenv
 from telegram import (
+    Bot,
     Update,
     ReplyKeyboardMarkup,
     ReplyKeyboardRemove,
@@ -19,8 +24,19 @@ from telegram.ext import (
     ContextTypes,
     filters,
 )
+from telegram.error import BadRequest
+from telegram.request import BaseRequest
 
+import metrics
+from admins import ROLES, AdminRegistry
 from db import DB
+from dish_index import normalize as _norm
+import export
+import reconcile
+from broadcast import Broadcast, TokenBucket, progress_text, run_with_progress
+from outbox import OutboxWorker
+from persistence import PostgresPersistence
+from processor import PerChatUpdateProcessor
 import sheets
 
 load_dotenv(dotenv_path=".env")
@@ -28,14 +44,19 @@ load_dotenv(dotenv_path=".env")
 
 # ---------- Admin helpers ----------
 def _admin_ids() -> set[int]:
+    # только начальное заполнение таблицы admins при старте (DB.seed_admins)
     raw = os.getenv("ADMIN_IDS", "").strip()
     if not raw:
         return set()
     return {int(x.strip()) for x in raw.split(",") if x.strip().isdigit()}
 
 
-def _is_admin(update: Update) -> bool:
-    return bool(update.effective_user and update.effective_user.id in _admin_ids())
+def _is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    return bool(update.effective_user and update.effective_user.id in context.application.bot_data["admins"])
+
+
+def _is_owner(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    return bool(update.effective_user and context.application.bot_data["admins"].is_owner(update.effective_user.id))
 
 
 # ---------- Group helpers ----------
@@ -60,81 +81,87 @@ def group_text(fid: int, date_str: str, dish: str, comment: str, reply: str) ->
     )
 
 
-def _row_get(row, key: str, default=None):
-    try:
-        return row[key]
-    except Exception:
-        return default
-
-
-async def _set_group_message_refs(db: DB, fid: int, chat_id: int, message_id: int):
+async def _publish_or_update_group(bot: Bot, db: DB, fid: int):
     """
-    Пытаемся сохранить group_chat_id/group_message_id в БД.
-    1) если у DB есть метод set_group_message_refs — используем
-    2) иначе пытаемся обновить SQL-ом (нужны колонки group_chat_id, group_message_id)
+    Публикация/обновление записи в группе (вызывается из outbox).
+    Берём актуальную строку из БД; сетевые ошибки пробрасываем — outbox повторит.
+    group_delete той же записи стоит в том же канале outbox и выполняется только после публикации.
     """
-    if hasattr(db, "set_group_message_refs"):
-        await getattr(db, "set_group_message_refs")(fid, chat_id, message_id)
-        return
-
-    # Fallback SQL (если у тебя нет метода, но есть колонки)
-    try:
-        await db.pool.execute(  # type: ignore
-            "UPDATE feedback SET group_chat_id=$2, group_message_id=$3 WHERE id=$1",
-            fid,
-            chat_id,
-            message_id,
-        )
-    except Exception:
-        # если нет колонок — просто молча не сохраним
-        pass
-
-
-async def _publish_or_update_group(
-    context: ContextTypes.DEFAULT_TYPE,
-    db: DB,
-    fid: int,
-    date_str: str,
-    dish: str,
-    comment: str,
-    reply: str,
-):
     gid = _group_chat_id()
     if not gid:
         return
 
     row = await db.get_feedback(fid)
-    if not row:
+    if not row or not row["kitchen_reply"]:
+        # запись уже удалили или ответа нет — публиковать нечего
         return
 
-    g_chat_id = _row_get(row, "group_chat_id", None)
-    g_msg_id = _row_get(row, "group_message_id", None)
+    g_chat_id = row["group_chat_id"]
+    g_msg_id = row["group_message_id"]
 
-    text = group_text(fid, date_str, dish, comment, reply)
+    date_str = row["feedback_date"].strftime("%d/%m/%y")
+    text = group_text(fid, date_str, row["dish_name"], row["guest_comment"], row["kitchen_reply"])
 
     if g_chat_id and g_msg_id:
         # Уже публиковали — обновляем
         try:
-            await context.bot.edit_message_text(
+            await bot.edit_message_text(
                 chat_id=int(g_chat_id),
                 message_id=int(g_msg_id),
                 text=text,
                 disable_web_page_preview=True,
             )
             return
-        except Exception:
-            pass
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return
+            # сообщение в группе удалили руками — публикуем заново
 
     # Ещё не публиковали — отправляем новое сообщение
-    try:
-        gmsg = await context.bot.send_message(
-            chat_id=gid,
-            text=text,
-            disable_web_page_preview=True,
-        )
-        await _set_group_message_refs(db, fid, gmsg.chat_id, gmsg.message_id)
-    except Exception:
-        pass
+    gmsg = await bot.send_message(
+        chat_id=gid,
+        text=text,
+        disable_web_page_preview=True,
+    )
+    if not await db.set_group_message_refs(fid, gmsg.chat_id, gmsg.message_id):
+        # запись удалили, пока отправляли: delete_feedback ссылок ещё не видел и group_delete
+        # не поставил — убираем сообщение сами, иначе оно останется в группе навсегда
+        try:
+            await bot.delete_message(chat_id=gmsg.chat_id, message_id=gmsg.message_id)
+        except BadRequest:
+            pass
+
+
+def _outbox_handlers(app: Application) -> dict:
+    db: DB = app.bot_data["db"]
+    writer: sheets.SheetsWriter = app.bot_data["sheets"]
+
+    async def sheets_append(fid: int, p: dict):
+        await writer.append(fid, p["date"], p["dish"], p["comment"], p["reply"])
+
+    async def sheets_update(fid: int, p: dict):
+        await writer.update(fid, p["date"], p["dish"], p["comment"], p["reply"])
+
+    async def sheets_delete(fid: int, p: dict):
+        await writer.delete(fid)
+
+    async def group_publish(fid: int, p: dict):
+        await _publish_or_update_group(app.bot, db, fid)
+
+    async def group_delete(fid: int, p: dict):
+        try:
+            await app.bot.delete_message(chat_id=p["chat_id"], message_id=p["message_id"])
+        except BadRequest:
+            # уже удалено или слишком старое — повторять бессмысленно
+            pass
+
+    return {
+        "sheets_append": sheets_append,
+        "sheets_update": sheets_update,
+        "sheets_delete": sheets_delete,
+        "group_publish": group_publish,
+        "group_delete": group_delete,
+    }
 
 
 async def chatid(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -146,10 +173,13 @@ async def _autoregister_subscriber(update: Update, context: ContextTypes.DEFAULT
     """
     Автоподписка только для лички.
     В группах не подписываем (чтобы рассылка не уходила в чаты).
+    Уже подписанных отсекаем по набору в памяти (DB.subscribers) — без запроса к БД.
     """
     if not update.effective_chat or update.effective_chat.type != "private":
         return
     db: DB = context.application.bot_data["db"]
+    if update.effective_chat.id in db.subscribers:
+        return
     try:
         await db.upsert_subscriber(update.effective_chat.id, update.effective_chat.type)
     except Exception:
@@ -196,14 +226,48 @@ async def _send_tracked(update: Update, context: ContextTypes.DEFAULT_TYPE, text
     return msg
 
 
-async def _cleanup_messages(context: ContextTypes.DEFAULT_TYPE) -> None:
-    items = context.user_data.get("cleanup_ids", [])
-    for chat_id, message_id in reversed(items):
+async def _delete_tracked(bot: Bot, items: list[tuple[int, int]]) -> None:
+    """
+    Удаление пачками: сообщения группируем по чату, до 100 id на один delete_messages.
+    Если пачка не прошла — удаляем её сообщения по одному, параллельно.
+    """
+    by_chat: dict[int, list[int]] = {}
+    for chat_id, message_id in items:
+        by_chat.setdefault(chat_id, []).append(message_id)
+
+    async def delete_chunk(chat_id: int, ids: list[int]):
         try:
-            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
+            await bot.delete_messages(chat_id=chat_id, message_ids=ids)
         except Exception:
-            pass
+            await asyncio.gather(
+                *(bot.delete_message(chat_id=chat_id, message_id=mid) for mid in ids),
+                return_exceptions=True,
+            )
+
+    await asyncio.gather(*(
+        delete_chunk(chat_id, ids[i:i + 100])
+        for chat_id, ids in by_chat.items()
+        for i in range(0, len(ids), 100)
+    ))
+
+
+async def _cleanup_messages(context: ContextTypes.DEFAULT_TYPE) -> None:
+    items = context.user_data.get("cleanup_ids", [])
     context.user_data["cleanup_ids"] = []
+    if items:
+        # в фоне — карточка/ответ пользователю не ждут уборки
+        context.application.create_task(_delete_tracked(context.bot, items))
+
+
+async def _fan_out(**steps) -> list:
+    """
+    Независимые шаги параллельно. Ошибка одного не отменяет остальные — логируем её.
+    """
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for name, res in zip(steps, results):
+        if isinstance(res, Exception):
+            print(f"[main] WARN: {name} failed: {res!r}")
+    return results
 
 
 # ---------- UI helpers ----------
@@ -260,67 +324,354 @@ def _set_auto_date(context: ContextTypes.DEFAULT_TYPE) -> None:
     context.user_data["date_str"] = now.strftime("%d/%m/%y")
 
 
-def _norm(s: str) -> str:
-    s = " ".join((s or "").strip().split()).lower()
-    s = s.replace("ё", "е")
-    return s
+async def search_dishes_strict(db: DB, query: str, limit: int = 10) -> list[str]:
+    # Поиск по in-memory индексу (загружается в on_startup, синхронизируется в upsert_dish/delete_dish)
+    opts = db.dishes.search(query, limit=limit)
+    if opts:
+        return opts
+    # Ничего не нашли по подстроке — один запрос в БД с триграммами (опечатки)
+    return await db.search_dishes(query, limit=limit)
 
 
-async def search_dishes_strict(db: DB, query: str, limit: int = 10) -> list[str]:
-    q = _norm(query)
-    if len(q) < 2:
-        return []
+# ---------- Period helpers ----------
+_DATE_FORMATS = ("%d.%m.%y", "%d.%m.%Y", "%d/%m/%y", "%d/%m/%Y", "%Y-%m-%d")
 
-    opts: list[str] = []
-    try:
-        opts = await db.search_dishes(q, limit=limit)
-    except Exception:
-        opts = []
 
-    if not opts:
+def _parse_date(s: str) -> date | None:
+    for fmt in _DATE_FORMATS:
         try:
-            parts = [p for p in q.split(" ") if len(p) >= 2]
-            if parts:
-                conds = " AND ".join([f"replace(lower(name),'ё','е') LIKE ${i+1}" for i in range(len(parts))])
-                params = [f"%{p}%" for p in parts] + [limit]
-                sql = f"""
-                    SELECT name
-                    FROM dishes
-                    WHERE {conds}
-                    ORDER BY name
-                    LIMIT ${len(parts)+1}
-                """
-                rows = await db.pool.fetch(sql, *params)  # type: ignore
-                opts = [r["name"] for r in rows]
-        except Exception:
-            opts = []
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_period(args: list[str]) -> tuple[date | None, date | None, list[str]]:
+    """
+    Период из первого аргумента команды: «17.10.26», «01.10.26-17.10.26», «7д»/«7d» (последние 7 дней).
+    Возвращает (с, по, остальные аргументы); если периода нет — (None, None, args).
+    Пустой («0д») или перевёрнутый диапазон — ValueError с текстом для пользователя.
+    """
+    if not args:
+        return None, None, []
+    head = args[0].strip().lower()
+    today = datetime.now().astimezone().date()
+
+    m = re.fullmatch(r"(\d{1,4})[дd]", head)
+    if m:
+        days = int(m.group(1))
+        if not days:
+            raise ValueError("Период «0д» пустой — укажите хотя бы 1д.")
+        return today - timedelta(days=days - 1), today, args[1:]
+
+    single = _parse_date(head)
+    if single:
+        return single, single, args[1:]
+    # диапазон: пробуем каждый разделитель, пока обе половины не окажутся датами (ISO тоже с дефисами)
+    for m in re.finditer(r"\.\.|[-–—]", head):
+        a, b = _parse_date(head[:m.start()]), _parse_date(head[m.end():])
+        if a and b:
+            if a > b:
+                raise ValueError(f"Начало периода позже конца: {args[0]}")
+            return a, b, args[1:]
+    return None, None, args
+
+
+def period_text(date_from: date | None, date_to: date | None) -> str:
+    if not date_from and not date_to:
+        return "за всё время"
+    f = (date_from or date.min).strftime("%d/%m/%y")
+    t = (date_to or date.max).strftime("%d/%m/%y")
+    return f"за {f}" if f == t else f"{f} – {t}"
+
+
+async def _resolve_dish(db: DB, query: str) -> tuple[str | None, list[str]]:
+    """
+    Название блюда для фильтра: точное совпадение или единственный вариант поиска.
+    Иначе (None, варианты) — пусть уточнят.
+    """
+    options = await search_dishes_strict(db, query, limit=10)
+    exact = [o for o in options if _norm(o) == _norm(query)]
+    if exact:
+        return exact[0], options
+    if len(options) == 1:
+        return options[0], options
+    return None, options
+
+
+# ---------- Feedback list (keyset) ----------
+LIST_PAGE_SIZE = 10
+# верхняя граница курсора «с конца»: больше любого SERIAL id
+_ID_MAX = 2**31 - 1
+
+
+def _short(s: str | None, n: int = 100) -> str:
+    s = " ".join((s or "").split())
+    return s if len(s) <= n else s[: n - 1] + "…"
+
+
+def list_text(f: dict, rows) -> str:
+    period = period_text(date.fromisoformat(f["from"]) if f["from"] else None,
+                         date.fromisoformat(f["to"]) if f["to"] else None)
+    head = f"📋 ОС {period}" + (f" · {f['dish']}" if f["dish"] else "")
+    if not rows:
+        return head + "\n\nНичего не нашёл."
+    items = [
+        f"#{r['id']} · {r['feedback_date'].strftime('%d/%m/%y')} · {r['dish_name']}\n"
+        f"💬 {_short(r['guest_comment'])}\n"
+        f"👨‍🍳 {_short(r['kitchen_reply']) or '—'}"
+        for r in rows
+    ]
+    return head + "\n\n" + "\n\n".join(items)
+
+
+def list_keyboard(rows, has_prev: bool, has_next: bool) -> InlineKeyboardMarkup | None:
+    if not rows:
+        return None
+    buttons = []
+    if has_prev:
+        first = rows[0]
+        buttons.append(InlineKeyboardButton("◀️ Новее", callback_data=f"lst:p:{first['feedback_date'].isoformat()}:{first['id']}"))
+    if has_next:
+        last = rows[-1]
+        buttons.append(InlineKeyboardButton("Старее ▶️", callback_data=f"lst:n:{last['feedback_date'].isoformat()}:{last['id']}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def list_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db: DB = context.application.bot_data["db"]
+    try:
+        date_from, date_to, rest = parse_period(context.args or [])
+    except ValueError as e:
+        return await update.message.reply_text(str(e))
+
+    dish = None
+    if rest:
+        dish, options = await _resolve_dish(db, " ".join(rest))
+        if not dish:
+            if not options:
+                return await update.message.reply_text("Не нашёл такое блюдо.")
+            return await update.message.reply_text("Уточните блюдо:\n" + "\n".join(f"• {o}" for o in options))
+
+    # фильтр живёт в user_data — кнопки несут только курсор (лимит callback_data 64 байта)
+    f = {
+        "from": date_from.isoformat() if date_from else None,
+        "to": date_to.isoformat() if date_to else None,
+        "dish": dish,
+    }
+    context.user_data["list_filter"] = f
+
+    rows, more = await db.feedback_page((date_to or date.max, _ID_MAX), date_from or date.min, dish, LIST_PAGE_SIZE)
+    await update.message.reply_text(list_text(f, rows), reply_markup=list_keyboard(rows, False, more))
+
+
+async def on_list_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    f = context.user_data.get("list_filter")
+    if not f:
+        return await q.answer("Список устарел — наберите /list ещё раз.", show_alert=True)
+    await q.answer()
+
+    db: DB = context.application.bot_data["db"]
+    _, direction, d, fid = q.data.split(":")
+    newer = direction == "p"
+    if newer:
+        bound = date.fromisoformat(f["to"]) if f["to"] else date.max
+    else:
+        bound = date.fromisoformat(f["from"]) if f["from"] else date.min
+
+    rows, more = await db.feedback_page((date.fromisoformat(d), int(fid)), bound, f["dish"], LIST_PAGE_SIZE, newer=newer)
+    if not rows:
+        return
+    has_prev, has_next = (more, True) if newer else (True, more)
+    try:
+        await q.edit_message_text(list_text(f, rows), reply_markup=list_keyboard(rows, has_prev, has_next))
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+
+
+# ---------- Stats ----------
+STATS_TOP = 15
+STATS_DEFAULT_DAYS = 7
+_SPARK = "▁▂▃▄▅▆▇█"
+# не больше стольких столбиков: длинный период сворачивается в недели/месяцы (лимит сообщения — 4096 символов)
+SPARK_MAX = 60
+
+
+def _sparkline(values: list[int]) -> str:
+    top = max(values, default=0)
+    if not top:
+        return _SPARK[0] * len(values)
+    return "".join(_SPARK[min(len(_SPARK) - 1, v * (len(_SPARK) - 1) // top)] for v in values)
+
+
+def _trend(now: int, prev: int) -> str:
+    d = now - prev
+    return f"▲{d}" if d > 0 else f"▼{-d}" if d < 0 else "="
+
+
+def _pct(part: int, whole: int) -> str:
+    return f"{part * 100 // whole}%" if whole else "—"
+
+
+def _series(date_from: date, date_to: date, daily) -> tuple[str, list[int]]:
+    """
+    Ряд для спарклайна: по дням, если влезает в SPARK_MAX, иначе по неделям от начала периода,
+    иначе по месяцам (по нескольку месяцев в столбике, если и их больше SPARK_MAX).
+    """
+    days = (date_to - date_from).days + 1
+    if days <= SPARK_MAX:
+        label, n = "По дням", days
+        key = lambda d: (d - date_from).days
+    elif days <= SPARK_MAX * 7:
+        label, n = "По неделям", -(-days // 7)
+        key = lambda d: (d - date_from).days // 7
+    else:
+        months = (date_to.year - date_from.year) * 12 + date_to.month - date_from.month + 1
+        step = -(-months // SPARK_MAX)
+        label, n = ("По месяцам" if step == 1 else f"По {step} мес."), -(-months // step)
+        key = lambda d: ((d.year - date_from.year) * 12 + d.month - date_from.month) // step
+    series = [0] * n
+    for r in daily:
+        series[key(r["day"])] += int(r["total"])
+    return label, series
+
+
+def stats_text(date_from: date, date_to: date, dish: str | None, dishes, daily) -> str:
+    label, series = _series(date_from, date_to, daily)
+
+    rows = [r for r in dishes if not dish or r["dish_name"] == dish]
+    total = sum(int(r["total"]) for r in rows)
+    replied = sum(int(r["replied"]) for r in rows)
+    prev = sum(int(r["prev_total"]) for r in rows)
+
+    lines = [
+        f"📊 Статистика {period_text(date_from, date_to)}" + (f" · {dish}" if dish else ""),
+        f"Записей: {total}, с ответом кухни: {replied} ({_pct(replied, total)})",
+        f"Прошлый период: {prev} ({_trend(total, prev)})",
+    ]
+    if len(series) > 1:
+        lines.append(f"{label}: {_sparkline(series)}")
+    if not dish:
+        top = [r for r in rows if r["total"]][:STATS_TOP]
+        if top:
+            lines.append("")
+            lines.append("Топ блюд по числу ОС:")
+            for i, r in enumerate(top, start=1):
+                lines.append(
+                    f"{i}. {r['dish_name']} — {r['total']} · ответ {_pct(r['replied'], r['total'])}"
+                    f" · {_trend(r['total'], r['prev_total'])}"
+                )
+    return "\n".join(lines)
+
+
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(update, context):
+        return await update.message.reply_text("Недостаточно прав.")
+    db: DB = context.application.bot_data["db"]
+
+    try:
+        date_from, date_to, rest = parse_period(context.args or [])
+    except ValueError as e:
+        return await update.message.reply_text(str(e))
+    if not date_from:
+        date_to = datetime.now().astimezone().date()
+        date_from = date_to - timedelta(days=STATS_DEFAULT_DAYS - 1)
+    # тренд — к такому же по длине периоду прямо перед выбранным
+    try:
+        prev_from = date_from - (date_to - date_from + timedelta(days=1))
+    except OverflowError:
+        prev_from = date.min
+
+    dish = None
+    if rest:
+        dish, options = await _resolve_dish(db, " ".join(rest))
+        if not dish:
+            if not options:
+                return await update.message.reply_text("Не нашёл такое блюдо.")
+            return await update.message.reply_text("Уточните блюдо:\n" + "\n".join(f"• {o}" for o in options))
+
+    dishes, daily = await asyncio.gather(
+        db.dish_stats(date_from, date_to, prev_from),
+        db.daily_stats(date_from, date_to, dish),
+    )
+    await update.message.reply_text(stats_text(date_from, date_to, dish, dishes, daily))
+
 
-    if not opts:
+# ---------- Export ----------
+async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(update, context):
+        return await update.message.reply_text("Недостаточно прав.")
+    db: DB = context.application.bot_data["db"]
+
+    args = list(context.args or [])
+    fmt = "csv"
+    if args and args[-1].lower() in ("csv", "xlsx"):
+        fmt = args.pop().lower()
+    try:
+        date_from, date_to, rest = parse_period(args)
+    except ValueError as e:
+        return await update.message.reply_text(str(e))
+    if rest:
+        return await update.message.reply_text("Использование: /export [период] [csv|xlsx], например /export 01.10.26-17.10.26 xlsx")
+    lo, hi = date_from or date.min, date_to or date.max
+    timeout = float(os.getenv("EXPORT_TIMEOUT", "600"))
+
+    await update.message.reply_text("⏳ Готовлю выгрузку…")
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
         try:
-            first = q.split(" ")[0]
-            if len(first) >= 2:
-                rows = await db.pool.fetch(
-                    """
-                    SELECT name
-                    FROM dishes
-                    WHERE replace(lower(name),'ё','е') LIKE $1
-                    ORDER BY name
-                    LIMIT $2
-                    """,
-                    f"%{first}%",
-                    limit,
-                )  # type: ignore
-                opts = [r["name"] for r in rows]
-        except Exception:
-            opts = []
+            if fmt == "xlsx":
+                n = await export.write_xlsx(db, lo, hi, path, timeout=timeout)
+            else:
+                n = await export.write_csv(db, lo, hi, path, timeout=timeout)
+        except ImportError:
+            fmt = "csv"
+            await update.message.reply_text("XLSX недоступен на сервере (нет openpyxl) — выгружаю CSV.")
+            n = await export.write_csv(db, lo, hi, path, timeout=timeout)
+
+        if not n:
+            return await update.message.reply_text("За этот период записей нет.")
+        if export.too_big(path):
+            return await update.message.reply_text("Файл больше 50 МБ — Telegram его не примет. Сузьте период.")
+
+        with open(path, "rb") as f:
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=f,
+                filename=export.file_name(lo, hi, fmt),
+                caption=f"📦 ОС {period_text(date_from, date_to)}: {n} записей",
+            )
+    finally:
+        os.remove(path)
+
+
+# ---------- Reconcile ----------
+async def reconcile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(update, context):
+        return await update.message.reply_text("Недостаточно прав.")
+    db: DB = context.application.bot_data["db"]
+    args = [a.lower() for a in (context.args or [])]
+    if args not in ([], ["fix"]):
+        return await update.message.reply_text("Использование: /reconcile [fix]")
+    apply = bool(args)
+
+    await update.message.reply_text("⏳ Сверяю базу с таблицей…")
+    try:
+        plan = await reconcile.reconcile(db, apply=apply, writer=context.application.bot_data.get("sheets"))
+    except Exception as e:
+        print(f"[reconcile] WARN: {e!r}")
+        return await update.message.reply_text("⚠️ Не удалось сверить с таблицей, подробности в логе.")
 
-    seen = set()
-    uniq: list[str] = []
-    for x in opts:
-        if x not in seen:
-            seen.add(x)
-            uniq.append(x)
-    return uniq[:limit]
+    if plan.clean:
+        tail = "✅ Расхождений нет."
+    elif apply:
+        tail = "✅ Таблица исправлена."
+    else:
+        tail = "Исправить: /reconcile fix"
+    await update.message.reply_text(f"🔁 Сверка БД ↔ таблица\n\n{plan.summary()}\n\n{tail}")
 
 
 # ---------- Help ----------
@@ -331,6 +682,8 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• /start или /new — начать новую запись\n"
         "• /skip — пропустить ответ кухни\n"
         "• /cancel — отменить текущий шаг\n\n"
+        "📋 Журнал:\n"
+        "• /list [период] [блюдо] — записи ОС, например /list 7д или /list 01.10.26-17.10.26 борщ\n\n"
         "Группа:\n"
         "• В группу уходит только запись с ответом кухни\n\n"
     )
@@ -361,6 +714,10 @@ WELCOME_TEXT = (
     "• /dadd Название — добавить блюдо\n"
     "• /ddel Название — удалить блюдо\n"
     "• /dlist — сколько блюд в базе\n"
+    "• /stats [период] [блюдо] — статистика ОС по блюдам (по умолчанию за 7 дней)\n"
+    "• /export [период] [csv|xlsx] — выгрузка ОС файлом\n"
+    "• /reconcile [fix] — сверить таблицу с базой (fix — исправить)\n"
+    "• /admins — список админов; /admin_add id [admin|owner], /admin_del id — для владельцев\n"
 )
 
 def welcome_keyboard() -> InlineKeyboardMarkup:
@@ -384,14 +741,14 @@ async def on_free_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ---------- Broadcast flow ----------
 async def broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _is_admin(update):
+    if not _is_admin(update, context):
         return await update.message.reply_text("Недостаточно прав.")
     await update.message.reply_text("✉️ Пришлите одним сообщением текст рассылки.\n/cancel — отмена.")
     return BROADCAST
 
 
 async def broadcast_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _is_admin(update):
+    if not _is_admin(update, context):
         return ConversationHandler.END
 
     text = (update.message.text or "").strip()
@@ -401,63 +758,112 @@ async def broadcast_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     db: DB = context.application.bot_data["db"]
     try:
-        chat_ids = await db.list_subscribers()
+        total = await db.count_subscribers()
+        job = await db.create_broadcast_job(text, update.effective_chat.id, total, _instance_id(context.application))
     except Exception:
         return await update.message.reply_text("Не могу получить список подписчиков (ошибка БД).")
 
-    sent = 0
-    failed = 0
-
-    for cid in chat_ids:
-        try:
-            await context.bot.send_message(chat_id=int(cid), text=text, disable_web_page_preview=True)
-            sent += 1
-            # лёгкая пауза, чтобы не упереться в лимиты
-            await asyncio.sleep(0.05)
-        except Exception:
-            failed += 1
+    b = _broadcast(context.application, job)
+    progress = await update.message.reply_text(progress_text(b))
+    b.progress_message_id = progress.message_id
+    await db.set_broadcast_progress_message(b.job_id, progress.message_id)
 
-    await update.message.reply_text(f"✅ Рассылка завершена.\nОтправлено: {sent}\nОшибок: {failed}")
+    # рассылка идёт в фоне, диалог админа свободен сразу
+    context.application.create_task(run_with_progress(b), update=update)
     return ConversationHandler.END
 
 
+def _instance_id(app: Application) -> str:
+    # владелец заданий рассылки: процесс, а не хост — две реплики на одной машине различаются
+    return app.bot_data.setdefault("instance_id", f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}")
+
+
+def _broadcast_lease() -> float:
+    return float(os.getenv("BROADCAST_LEASE", "60"))
+
+
+def _broadcast(app: Application, job) -> Broadcast:
+    return Broadcast(
+        app.bot,
+        app.bot_data["limiter"],
+        app.bot_data["db"],
+        job,
+        owner=_instance_id(app),
+        lease=_broadcast_lease(),
+        concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "10")),
+    )
+
+
+async def _claim_broadcasts(app: Application) -> None:
+    """
+    Раз в аренду забираем задания без живого владельца: прерванные рестартом, rolling deploy
+    или падением другой реплики. Задание с живым heartbeat никто, кроме владельца, не шлёт.
+    """
+    db: DB = app.bot_data["db"]
+    lease = _broadcast_lease()
+    while True:
+        try:
+            for job in await db.claim_broadcast_jobs(_instance_id(app), lease):
+                print(f"[broadcast] resuming job #{job['id']}")
+                app.create_task(run_with_progress(_broadcast(app, job)))
+        except Exception as e:
+            print(f"[broadcast] ERROR: claim failed: {e!r}")
+        await asyncio.sleep(lease)
+
+
 # ---------- Admin dish commands (как было) ----------
 async def whoami(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(f"Ваш user_id: {update.effective_user.id}")
 
 
 async def dadd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _is_admin(update):
+    if not _is_admin(update, context):
         return await update.message.reply_text("Недостаточно прав.")
     name = " ".join(context.args).strip()
     if not name:
         return await update.message.reply_text("Использование: /dadd Название блюда")
     db: DB = context.application.bot_data["db"]
-    await db.upsert_dish(name)
-    await update.message.reply_text(f"✅ Добавил: {name}")
+    if await db.upsert_dish(name):
+        await update.message.reply_text(f"✅ Добавил: {name}")
+    else:
+        await update.message.reply_text(f"Уже есть: {name} (с точностью до регистра, ё/е и пробелов)")
 
 
 async def ddel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _is_admin(update):
+    if not _is_admin(update, context):
         return await update.message.reply_text("Недостаточно прав.")
     name = " ".join(context.args).strip()
     if not name:
         return await update.message.reply_text("Использование: /ddel Название блюда")
     db: DB = context.application.bot_data["db"]
-    await db.pool.execute("DELETE FROM dishes WHERE name=$1", name)  # type: ignore
+    await db.delete_dish(name)
     await update.message.reply_text(f"🗑 Удалил (если было): {name}")
 
 
 async def dlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _is_admin(update):
+    if not _is_admin(update, context):
+        return await update.message.reply_text("Недостаточно прав.")
+    db: DB = context.application.bot_data["db"]
+    await update.message.reply_text(f"🍽 Блюд в базе: {await db.count_dishes()}")
+
+
+async def dbstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(update, context):
         return await update.message.reply_text("Недостаточно прав.")
     db: DB = context.application.bot_data["db"]
-    row = await db.pool.fetchrow("SELECT COUNT(*) AS c FROM dishes")  # type: ignore
-    await update.message.reply_text(f"🍽 Блюд в базе: {row['c']}")
+    st = db.pool_stats()
+    dead = await db.count_dead_outbox()
+    await update.message.reply_text(
+        "🗄 Пул БД\n"
+        f"Соединений: {st['size']} (занято {st['in_use']}, свободно {st['idle']}), лимит {st['min_size']}–{st['max_size']}\n"
+        f"Выдач: {st['acquired']}, ожидание ср. {st['wait_avg_ms']:.1f} мс, макс. {st['wait_max_ms']:.1f} мс\n"
+        f"Пул был занят целиком: {st['saturated']} раз, таймаутов: {st['timeouts']}\n"
+        f"Outbox: невыполнимых событий (status='dead'): {dead}"
+    )
 
 
 async def dbulk(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _is_admin(update):
+    if not _is_admin(update, context):
         return await update.message.reply_text("Недостаточно прав.")
     await update.message.reply_text(
         "Пришлите одним сообщением список блюд (по одному в строке).",
@@ -467,7 +873,7 @@ async def dbulk(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def dbulk_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _is_admin(update):
+    if not _is_admin(update, context):
         return ConversationHandler.END
 
     text = (update.message.text or "").strip()
@@ -477,14 +883,57 @@ async def dbulk_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return BULK_DISHES
 
     db: DB = context.application.bot_data["db"]
-    added = 0
-    for name in lines:
-        await db.upsert_dish(name)
-        added += 1
-    await update.message.reply_text(f"✅ Импортировал блюд: {added}")
+    added, existing = await db.bulk_upsert_dishes(lines)
+    await update.message.reply_text(f"✅ Импортировал блюд: {added}\nУже были в базе: {existing}")
     return ConversationHandler.END
 
 
+# ---------- Admins ----------
+_ROLE_TITLES = {"owner": "владелец", "admin": "админ"}
+
+
+async def admins_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(update, context):
+        return await update.message.reply_text("Недостаточно прав.")
+    registry: AdminRegistry = context.application.bot_data["admins"]
+    lines = [f"• {uid} — {_ROLE_TITLES[role]}" for uid, role in registry.items()]
+    await update.message.reply_text("👥 Админы:\n" + "\n".join(lines))
+
+
+async def admin_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_owner(update, context):
+        return await update.message.reply_text("Недостаточно прав (нужен владелец).")
+    args = list(context.args or [])
+    role = args.pop().lower() if len(args) == 2 else "admin"
+    if len(args) != 1 or not args[0].isdigit() or role not in ROLES:
+        return await update.message.reply_text("Использование: /admin_add user_id [admin|owner]\nuser_id человек узнаёт через /whoami")
+    user_id = int(args[0])
+    if user_id == update.effective_user.id:
+        return await update.message.reply_text("Свою роль менять нельзя.")
+
+    registry: AdminRegistry = context.application.bot_data["admins"]
+    await registry.set(user_id, role, added_by=update.effective_user.id)
+    await update.message.reply_text(f"✅ {user_id} — {_ROLE_TITLES[role]}")
+
+
+async def admin_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_owner(update, context):
+        return await update.message.reply_text("Недостаточно прав (нужен владелец).")
+    args = context.args or []
+    if len(args) != 1 or not args[0].isdigit():
+        return await update.message.reply_text("Использование: /admin_del user_id")
+    user_id = int(args[0])
+    # себя не удаляем — так в таблице всегда остаётся хотя бы один владелец
+    if user_id == update.effective_user.id:
+        return await update.message.reply_text("Себя удалить нельзя.")
+
+    registry: AdminRegistry = context.application.bot_data["admins"]
+    if await registry.remove(user_id):
+        await update.message.reply_text(f"🗑 {user_id} больше не админ.")
+    else:
+        await update.message.reply_text(f"{user_id} не был админом.")
+
+
 # ---------- Main flow ----------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     _set_auto_date(context)
@@ -652,25 +1101,24 @@ async def finalize(update: Update, context: ContextTypes.DEFAULT_TYPE, kitchen_r
     dish = context.user_data["dish"]
     comment = context.user_data["comment"]
 
-    await db.upsert_dish(dish)
+    # справочник блюд и сама запись друг от друга не зависят
+    upsert = asyncio.create_task(db.upsert_dish(dish))
+    # запись + события для Sheets/группы (outbox) — одной транзакцией
     fid = await db.create_feedback(date_obj, dish, comment, kitchen_reply)
 
-    # Личная карточка (с кнопками)
+    # Личная карточка (с кнопками) — нужен fid
     msg = await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text=card_text(fid, date_str, dish, comment, kitchen_reply),
         reply_markup=card_keyboard(fid),
     )
-    await db.set_message_refs(fid, msg.chat_id, msg.message_id)
 
-    # Sheets
-    await asyncio.to_thread(sheets.append_feedback_row, fid, date_str, dish, comment, kitchen_reply)
-
-    # В группу — ТОЛЬКО если есть ответ кухни
-    if kitchen_reply:
-        await _publish_or_update_group(context, db, fid, date_str, dish, comment, kitchen_reply)
-
-    await _cleanup_messages(context)
+    # ссылки на карточку нужны только после неё; уборка и справочник — независимо
+    await _fan_out(
+        set_message_refs=db.set_message_refs(fid, msg.chat_id, msg.message_id),
+        cleanup=_cleanup_messages(context),
+        upsert_dish=upsert,
+    )
     context.user_data.clear()
     return ConversationHandler.END
 
@@ -703,8 +1151,8 @@ async def save_edited_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await _send_tracked(update, context, "Ответ не должен быть пустым. Введите ещё раз:")
         return EDIT_REPLY
 
-    await db.update_kitchen_reply(fid, reply_text)
-    row = await db.get_feedback(fid)
+    # ответ + события для Sheets/группы (outbox) — одной транзакцией
+    row = await db.update_kitchen_reply(fid, reply_text)
     if not row:
         await _cleanup_messages(context)
         context.user_data.clear()
@@ -717,22 +1165,16 @@ async def save_edited_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = row["telegram_chat_id"]
     message_id = row["telegram_message_id"]
 
-    # Обновляем личную карточку
-    await context.bot.edit_message_text(
-        chat_id=chat_id,
-        message_id=message_id,
-        text=card_text(fid, date_str, dish, comment, reply),
-        reply_markup=card_keyboard(fid),
+    # Обновляем личную карточку и убираем подсказки параллельно
+    await _fan_out(
+        edit_card=context.bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=card_text(fid, date_str, dish, comment, reply),
+            reply_markup=card_keyboard(fid),
+        ),
+        cleanup=_cleanup_messages(context),
     )
-
-    # Обновляем Google Sheets
-    await asyncio.to_thread(sheets.update_feedback_row, fid, date_str, dish, comment, reply)
-
-    # Публикуем/обновляем в группе
-    if reply:
-        await _publish_or_update_group(context, db, fid, date_str, dish, comment, reply)
-
-    await _cleanup_messages(context)
     context.user_data.clear()
     return ConversationHandler.END
 
@@ -786,53 +1228,120 @@ async def on_delete_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     private_chat_id = row["telegram_chat_id"]
     private_message_id = row["telegram_message_id"]
 
-    group_chat_id = _row_get(row, "group_chat_id", None)
-    group_message_id = _row_get(row, "group_message_id", None)
-
     # 2) Удаляем карточку в личке
     try:
         await context.bot.delete_message(chat_id=private_chat_id, message_id=private_message_id)
     except Exception:
         pass
 
-    # 3) Удаляем сообщение в группе (если было)
-    if group_chat_id and group_message_id:
-        try:
-            await context.bot.delete_message(chat_id=int(group_chat_id), message_id=int(group_message_id))
-        except Exception:
-            pass
-
-    # 4) Удаляем строку в Sheets
-    try:
-        await asyncio.to_thread(sheets.delete_feedback_row, fid)
-    except Exception:
-        pass
-
-    # 5) Удаляем из БД (последним)
+    # 3) Удаляем из БД; сообщение в группе и строку в Sheets уберёт outbox
     await db.delete_feedback(fid)
 
 
 # ---------- Lifecycle ----------
 async def on_startup(app: Application):
-    db = DB(os.environ["DATABASE_URL"])
+    # DB создаётся в main() — она же нужна persistence ещё до post_init
+    db: DB = app.bot_data["db"]
     await db.connect()
-    app.bot_data["db"] = db
+    await db.load_dish_index()
+    await db.load_subscribers()
+
+    # права: таблица admins (ADMIN_IDS — только затравка), копия в памяти, сброс по NOTIFY admins
+    await db.seed_admins(_admin_ids())
+    registry = AdminRegistry(db, ttl=float(os.getenv("ADMINS_TTL", "300")))
+    await registry.refresh()
+    await db.listen("admins", registry.invalidate, resync=registry.refresh)
+    registry.start()
+    app.bot_data["admins"] = registry
+
+    writer = sheets.SheetsWriter(
+        flush_interval=float(os.getenv("SHEETS_FLUSH_INTERVAL", "2")),
+        max_batch=int(os.getenv("SHEETS_MAX_BATCH", "50")),
+    )
+    writer.start()
+    app.bot_data["sheets"] = writer
+
+    # общий лимитер рассылок: держимся ниже ~30 сообщений/с у Telegram
+    app.bot_data["limiter"] = TokenBucket(rate=float(os.getenv("BROADCAST_RATE", "25")))
+
+    # незавершённые рассылки без живого владельца — продолжаем с курсора (см. _claim_broadcasts)
+    app.bot_data["broadcast_claimer"] = asyncio.create_task(_claim_broadcasts(app))
+
+    worker = OutboxWorker(db, _outbox_handlers(app), max_attempts=int(os.getenv("OUTBOX_MAX_ATTEMPTS", "12")))
+    await db.listen("outbox", worker.wake)
+    worker.start()
+    app.bot_data["outbox"] = worker
+
+    _register_metrics(app)
+    port = (os.getenv("METRICS_PORT") or "").strip()
+    if port:
+        app.bot_data["metrics_server"] = await metrics.serve(os.getenv("METRICS_HOST", "127.0.0.1"), int(port))
+
+
+def _register_metrics(app: Application) -> None:
+    db: DB = app.bot_data["db"]
+    writer: sheets.SheetsWriter = app.bot_data["sheets"]
+    worker: OutboxWorker = app.bot_data["outbox"]
+
+    metrics.QUEUE_DEPTH.set_source("update_queue", app.update_queue.qsize)
+    metrics.QUEUE_DEPTH.set_source("updates_in_flight", lambda: app.update_processor.current_concurrent_updates)
+    metrics.QUEUE_DEPTH.set_source("sheets_writer", lambda: len(writer))
+    metrics.QUEUE_DEPTH.set_source("outbox_in_flight", lambda: worker.in_flight)
+    if app.persistence is not None:
+        metrics.QUEUE_DEPTH.set_source("persistence", lambda: app.persistence.pending)
+
+    for state in ("size", "idle", "in_use"):
+        metrics.DB_POOL.set_source(state, lambda state=state: db.pool_stats()[state])
+    for kind in ("acquired", "saturated", "timeouts", "wait_total_seconds", "listen_reconnects"):
+        metrics.DB_POOL_TOTALS.set_source(kind, lambda kind=kind: db.pool_stats()[kind])
 
 
 async def on_shutdown(app: Application):
+    server = app.bot_data.get("metrics_server")
+    if server:
+        server.close()
+        await server.wait_closed()
+
+    claimer: asyncio.Task = app.bot_data.get("broadcast_claimer")
+    if claimer:
+        claimer.cancel()
+
+    worker: OutboxWorker = app.bot_data.get("outbox")
+    if worker:
+        await worker.stop()
+
+    registry: AdminRegistry = app.bot_data.get("admins")
+    if registry:
+        await registry.stop()
+
+    writer: sheets.SheetsWriter = app.bot_data.get("sheets")
+    if writer:
+        await writer.stop()
+
     db: DB = app.bot_data.get("db")
     if db:
         await db.close()
 
 
-def main():
+def build_app(db: DB, token: str | None = None, request: BaseRequest | None = None) -> Application:
+    """
+    Приложение со всеми хендлерами. request — подмена Bot API (loadtest.py), по умолчанию настоящий.
+    """
+    persistence = PostgresPersistence(db, update_interval=float(os.getenv("PERSISTENCE_INTERVAL", "10")))
+
     app = (
         Application.builder()
-        .token(os.environ["TELEGRAM_TOKEN"])
+        .token(token or os.environ["TELEGRAM_TOKEN"])
+        # замер каждого вызова Bot API (getUpdates идёт отдельным запросом и не учитывается)
+        .request(request or metrics.TelegramRequest(connection_pool_size=256))
+        .persistence(persistence)
         .post_init(on_startup)
         .post_shutdown(on_shutdown)
+        # разные чаты — параллельно, один чат — по порядку
+        .concurrent_updates(PerChatUpdateProcessor(int(os.getenv("UPDATE_CONCURRENCY", "32"))))
         .build()
     )
+    app.bot_data["db"] = db
 
     new_conv = ConversationHandler(
         entry_points=[
@@ -851,6 +1360,8 @@ def main():
         },
         fallbacks=[CommandHandler("cancel", cancel)],
         allow_reentry=True,
+        name="new_conv",
+        persistent=True,
     )
 
     edit_conv = ConversationHandler(
@@ -858,6 +1369,8 @@ def main():
         states={EDIT_REPLY: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_edited_reply)]},
         fallbacks=[CommandHandler("cancel", cancel)],
         allow_reentry=True,
+        name="edit_conv",
+        persistent=True,
     )
 
     bulk_conv = ConversationHandler(
@@ -865,6 +1378,8 @@ def main():
         states={BULK_DISHES: [MessageHandler(filters.TEXT & ~filters.COMMAND, dbulk_receive)]},
         fallbacks=[CommandHandler("cancel", cancel)],
         allow_reentry=True,
+        name="bulk_conv",
+        persistent=True,
     )
 
     broadcast_conv = ConversationHandler(
@@ -872,6 +1387,8 @@ def main():
         states={BROADCAST: [MessageHandler(filters.TEXT & ~filters.COMMAND, broadcast_send)]},
         fallbacks=[CommandHandler("cancel", cancel)],
         allow_reentry=True,
+        name="broadcast_conv",
+        persistent=True,
     )
 
     app.add_handler(new_conv)
@@ -883,6 +1400,9 @@ def main():
     app.add_handler(CallbackQueryHandler(on_delete_confirm, pattern=r"^del:\d+$"))
     app.add_handler(CallbackQueryHandler(on_delete_cancel, pattern=r"^delcancel:\d+$"))
 
+    app.add_handler(CommandHandler("list", list_cmd))
+    app.add_handler(CallbackQueryHandler(on_list_page, pattern=r"^lst:[np]:\d{4}-\d{2}-\d{2}:\d+$"))
+
     app.add_handler(CallbackQueryHandler(help_from_button, pattern=r"^help$"))
     app.add_handler(CommandHandler("help", help_cmd))
 
@@ -897,11 +1417,52 @@ def main():
     app.add_handler(CommandHandler("dadd", dadd))
     app.add_handler(CommandHandler("ddel", ddel))
     app.add_handler(CommandHandler("dlist", dlist))
+    app.add_handler(CommandHandler("dbstats", dbstats))
+    app.add_handler(CommandHandler("stats", stats_cmd))
+    app.add_handler(CommandHandler("export", export_cmd))
+    app.add_handler(CommandHandler("reconcile", reconcile_cmd))
+    app.add_handler(CommandHandler("admins", admins_cmd))
+    app.add_handler(CommandHandler("admin_add", admin_add))
+    app.add_handler(CommandHandler("admin_del", admin_del))
 
     # ВАЖНО: свободный текст — последним, чтобы не ломать диалоги
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_free_text))
 
-    app.run_polling(close_loop=False)
+    # время/ошибки каждого хендлера — после регистрации всех
+    metrics.instrument_handlers(app)
+    return app
+
+
+def main():
+    _run(build_app(DB(os.environ["DATABASE_URL"])))
+
+
+def _run(app: Application) -> None:
+    """
+    BOT_MODE=polling (по умолчанию) или webhook. Хендлеры одинаковые в обоих режимах.
+    Для webhook: WEBHOOK_URL — публичный адрес, WEBHOOK_SECRET — проверка заголовка
+    X-Telegram-Bot-Api-Secret-Token (обязательна), PORT/WEBHOOK_LISTEN — где слушать.
+    """
+    mode = (os.getenv("BOT_MODE") or "polling").strip().lower()
+    if mode != "webhook":
+        app.run_polling(close_loop=False)
+        return
+
+    # без секрета любой, кто узнал URL, пришлёт апдейт от имени владельца (права — по effective_user)
+    secret = (os.getenv("WEBHOOK_SECRET") or "").strip()
+    if not secret:
+        raise RuntimeError("WEBHOOK_SECRET is required when BOT_MODE=webhook")
+
+    base_url = os.environ["WEBHOOK_URL"].rstrip("/")
+    url_path = (os.getenv("WEBHOOK_PATH") or "telegram").strip("/")
+    app.run_webhook(
+        listen=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8080")),
+        url_path=url_path,
+        webhook_url=f"{base_url}/{url_path}",
+        secret_token=secret,
+        close_loop=False,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,248 @@
+import time
+import asyncio
+import bisect
+import functools
+import threading
+
+from telegram.ext import Application, BaseHandler, ConversationHandler
+from telegram.request import HTTPXRequest
+
+# Встроенные метрики в текстовом формате Prometheus (без внешних зависимостей).
+# Запись — пара сложений под локом (Sheets пишет из потоков), рендер — только по запросу /metrics.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, n: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, v in items:
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {v}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам (+Inf последним), сумма]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        names = self.labelnames + ("le",)
+        for labels, counts, total in items:
+            acc = 0
+            for le, c in zip(self.buckets + ("+Inf",), counts):
+                acc += c
+                lines.append(f"{self.name}_bucket{_fmt_labels(names, labels + (le,))} {acc}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {acc}")
+        return lines
+
+
+class Gauge:
+    """
+    Значения снимаются в момент рендера: sources[метка] = функция без аргументов.
+    """
+
+    def __init__(self, name: str, help: str, labelname: str, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.labelname = labelname
+        self.kind = kind
+        self.sources: dict[str, object] = {}
+
+    def set_source(self, label: str, fn) -> None:
+        self.sources[label] = fn
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for label, fn in list(self.sources.items()):
+            try:
+                v = fn()
+            except Exception:
+                continue
+            lines.append(f"{self.name}{_fmt_labels((self.labelname,), (label,))} {v}")
+        return lines
+
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Handler latency", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handler exceptions", ("handler",))
+DB_SECONDS = Histogram("bot_db_query_seconds", "DB query latency incl. pool wait", ("query",))
+DB_ERRORS = Counter("bot_db_errors_total", "DB query errors", ("query",))
+TG_SECONDS = Histogram("bot_telegram_request_seconds", "Bot API request latency", ("method",))
+TG_ERRORS = Counter("bot_telegram_errors_total", "Bot API errors (network or HTTP >= 400)", ("method",))
+SHEETS_SECONDS = Histogram("bot_sheets_seconds", "Google Sheets operation latency", ("op",))
+SHEETS_ERRORS = Counter("bot_sheets_errors_total", "Google Sheets operation errors", ("op",))
+OUTBOX_DEAD = Counter("bot_outbox_dead_total", "Outbox events given up on (status='dead')", ("kind",))
+QUEUE_DEPTH = Gauge("bot_queue_depth", "Items waiting in in-process queues", "queue")
+DB_POOL = Gauge("bot_db_pool", "DB pool connections", "state")
+DB_POOL_TOTALS = Gauge("bot_db_pool_total", "DB pool checkout counters", "kind", kind="counter")
+
+REGISTRY = [
+    HANDLER_SECONDS, HANDLER_ERRORS,
+    DB_SECONDS, DB_ERRORS,
+    TG_SECONDS, TG_ERRORS,
+    SHEETS_SECONDS, SHEETS_ERRORS,
+    OUTBOX_DEAD,
+    QUEUE_DEPTH, DB_POOL, DB_POOL_TOTALS,
+]
+
+
+def render() -> str:
+    lines: list[str] = []
+    for m in REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+class timed:
+    """
+    with timed(HIST, ERRORS, "label"): ...  — время в гистограмму, исключение — в счётчик ошибок.
+    Работает и в синхронном коде (потоки Sheets), и внутри корутин.
+    """
+
+    __slots__ = ("hist", "errors", "label", "t0")
+
+    def __init__(self, hist: Histogram, errors: Counter, label: str):
+        self.hist = hist
+        self.errors = errors
+        self.label = label
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.hist.observe(time.perf_counter() - self.t0, self.label)
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self.errors.inc(self.label)
+        return False
+
+
+# ---------- Handlers ----------
+def _wrap_callback(cb, label: str):
+    if getattr(cb, "_metrics_label", None):
+        return cb
+
+    @functools.wraps(cb)
+    async def wrapper(update, context):
+        with timed(HANDLER_SECONDS, HANDLER_ERRORS, label):
+            return await cb(update, context)
+
+    wrapper._metrics_label = label
+    return wrapper
+
+
+def _instrument(handler: BaseHandler) -> None:
+    if isinstance(handler, ConversationHandler):
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for hs in handler.states.values():
+            nested.extend(hs)
+        for h in nested:
+            _instrument(h)
+        return
+    cb = handler.callback
+    handler.callback = _wrap_callback(cb, getattr(cb, "__name__", type(handler).__name__))
+
+
+def instrument_handlers(app: Application) -> None:
+    """
+    Обернуть колбэки всех зарегистрированных хендлеров (включая вложенные в диалоги):
+    метка — имя функции (get_dish, finalize, save_edited_reply, ...).
+    """
+    for group in app.handlers.values():
+        for handler in group:
+            _instrument(handler)
+
+
+# ---------- Bot API ----------
+class TelegramRequest(HTTPXRequest):
+    """
+    HTTPXRequest с замером каждого вызова Bot API: метка — имя метода (sendMessage, editMessageText, ...).
+    """
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        t0 = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except BaseException as e:
+            TG_SECONDS.observe(time.perf_counter() - t0, api_method)
+            if not isinstance(e, asyncio.CancelledError):
+                TG_ERRORS.inc(api_method)
+            raise
+        TG_SECONDS.observe(time.perf_counter() - t0, api_method)
+        if code >= 400:
+            TG_ERRORS.inc(api_method)
+        return code, payload
+
+
+# ---------- HTTP endpoint ----------
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await reader.readline()
+        # заголовки не нужны — дочитываем до пустой строки
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.split()
+        path = parts[1].split(b"?")[0] if len(parts) > 1 else b"/"
+        if path == b"/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        print(f"[metrics] WARN: request failed: {e!r}")
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int) -> asyncio.AbstractServer:
+    server = await asyncio.start_server(_handle, host, port)
+    print(f"[metrics] listening on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,199 @@
+import asyncpg
+
+# Версионированные миграции схемы. Новые шаги — только в конец списка, старые не менять.
+# Все шаги идемпотентны (IF NOT EXISTS): базы, поднятые старым CREATE_SQL, проходят их без ошибок.
+MIGRATIONS: list[tuple[int, str, str]] = [
+    (1, "base", """
+CREATE TABLE IF NOT EXISTS dishes (
+  id SERIAL PRIMARY KEY,
+  name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS feedback (
+  id SERIAL PRIMARY KEY,
+  feedback_date DATE NOT NULL,
+  dish_name TEXT NOT NULL,
+  guest_comment TEXT NOT NULL,
+  kitchen_reply TEXT NULL,
+  telegram_chat_id BIGINT NULL,
+  telegram_message_id BIGINT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_dishes_name ON dishes (name);
+CREATE INDEX IF NOT EXISTS idx_feedback_id ON feedback (id);
+"""),
+    (2, "subscribers_and_group_refs", """
+CREATE TABLE IF NOT EXISTS subscribers (
+  chat_id BIGINT PRIMARY KEY,
+  chat_type TEXT NOT NULL DEFAULT 'private',
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE feedback ADD COLUMN IF NOT EXISTS group_chat_id BIGINT NULL;
+ALTER TABLE feedback ADD COLUMN IF NOT EXISTS group_message_id BIGINT NULL;
+"""),
+    (3, "dishes_name_norm_trgm", """
+-- Нормализованное название (регистр, ё→е, пробелы) + триграммный индекс для поиска
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+ALTER TABLE dishes ADD COLUMN IF NOT EXISTS name_norm TEXT
+  GENERATED ALWAYS AS (
+    replace(lower(regexp_replace(btrim(name), '[[:space:]]+', ' ', 'g')), 'ё', 'е')
+  ) STORED;
+CREATE INDEX IF NOT EXISTS idx_dishes_name_norm_trgm ON dishes USING gin (name_norm gin_trgm_ops);
+"""),
+    (4, "outbox", """
+-- Outbox: побочные эффекты (Sheets, группа) пишутся в той же транзакции, что и feedback
+CREATE TABLE IF NOT EXISTS outbox (
+  id BIGSERIAL PRIMARY KEY,
+  feedback_id INT NOT NULL,
+  kind TEXT NOT NULL,
+  payload JSONB NOT NULL DEFAULT '{}',
+  attempts INT NOT NULL DEFAULT 0,
+  last_error TEXT NULL,
+  next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_feedback ON outbox (feedback_id, id);
+"""),
+    (5, "broadcast_jobs", """
+-- Рассылки: задание + состояние доставки по каждому получателю (для продолжения после рестарта)
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+  id SERIAL PRIMARY KEY,
+  text TEXT NOT NULL,
+  admin_chat_id BIGINT NULL,
+  progress_message_id BIGINT NULL,
+  status TEXT NOT NULL DEFAULT 'running',
+  last_chat_id BIGINT NULL,
+  total INT NOT NULL DEFAULT 0,
+  sent INT NOT NULL DEFAULT 0,
+  failed INT NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  finished_at TIMESTAMPTZ NULL
+);
+
+CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+  job_id INT NOT NULL REFERENCES broadcast_jobs(id) ON DELETE CASCADE,
+  chat_id BIGINT NOT NULL,
+  status TEXT NOT NULL,
+  error TEXT NULL,
+  PRIMARY KEY (job_id, chat_id)
+);
+"""),
+    (6, "persistence", """
+-- Состояние диалогов и user_data (PostgresPersistence)
+CREATE TABLE IF NOT EXISTS bot_user_data (
+  user_id BIGINT PRIMARY KEY,
+  data BYTEA NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS bot_conversations (
+  name TEXT NOT NULL,
+  key TEXT NOT NULL,
+  state BYTEA NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (name, key)
+);
+"""),
+    (7, "feedback_keyset_indexes", """
+-- Листание журнала ОС по ключу (feedback_date, id), в т.ч. с фильтром по блюду.
+-- idx_feedback_id дублировал первичный ключ.
+CREATE INDEX IF NOT EXISTS idx_feedback_date_id ON feedback (feedback_date, id);
+CREATE INDEX IF NOT EXISTS idx_feedback_dish_date_id ON feedback (dish_name, feedback_date, id);
+DROP INDEX IF EXISTS idx_feedback_id;
+"""),
+    (8, "feedback_daily_stats", """
+-- Сводка по дням × блюдам для /stats; ведётся в тех же транзакциях, что и feedback (см. DB.bump_stats)
+CREATE TABLE IF NOT EXISTS feedback_daily_stats (
+  day DATE NOT NULL,
+  dish_name TEXT NOT NULL,
+  total INT NOT NULL DEFAULT 0,
+  replied INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, dish_name)
+);
+
+INSERT INTO feedback_daily_stats(day, dish_name, total, replied)
+SELECT feedback_date, dish_name, COUNT(*), COUNT(*) FILTER (WHERE COALESCE(kitchen_reply, '') <> '')
+FROM feedback
+GROUP BY feedback_date, dish_name
+ON CONFLICT (day, dish_name) DO UPDATE SET total = EXCLUDED.total, replied = EXCLUDED.replied;
+"""),
+    (9, "admins", """
+-- Админы и роли вместо ADMIN_IDS (он теперь только начальное заполнение, см. DB.seed_admins)
+-- owner — всё, включая управление админами; admin — команды блюд, рассылки, статистика
+CREATE TABLE IF NOT EXISTS admins (
+  user_id BIGINT PRIMARY KEY,
+  role TEXT NOT NULL DEFAULT 'admin' CHECK (role IN ('owner', 'admin')),
+  added_by BIGINT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+"""),
+    (10, "subscribers_active", """
+-- Чаты, где бот заблокирован/удалён, не удаляем, а выключаем (см. DB.record_deliveries):
+-- рассылки их пропускают, /start снова включает
+ALTER TABLE subscribers ADD COLUMN IF NOT EXISTS active BOOLEAN NOT NULL DEFAULT TRUE;
+ALTER TABLE subscribers ADD COLUMN IF NOT EXISTS deactivated_at TIMESTAMPTZ NULL;
+CREATE INDEX IF NOT EXISTS idx_subscribers_active ON subscribers (chat_id) WHERE active;
+"""),
+    (11, "outbox_dead_letter", """
+-- Невыполнимые события (бота убрали из группы, кончились попытки) не повторяются вечно, а остаются
+-- со status='dead' для разбора. Порядок — внутри (feedback_id, channel): сломанная публикация
+-- в группе не держит записи в Sheets той же записи
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'pending';
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS channel TEXT GENERATED ALWAYS AS (split_part(kind, '_', 1)) STORED;
+DROP INDEX IF EXISTS idx_outbox_feedback;
+CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (feedback_id, channel, id) WHERE status = 'pending';
+"""),
+    (12, "broadcast_job_lease", """
+-- Задание рассылки шлёт только владелец (процесс), пока продлевает heartbeat_at (см. DB.claim_broadcast_jobs):
+-- при rolling deploy / нескольких репликах одно задание не уходит дважды
+ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS owner TEXT NULL;
+ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ NULL;
+ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS last_error TEXT NULL;
+"""),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+# ключ pg_advisory_xact_lock: несколько реплик не мигрируют одновременно
+_LOCK_KEY = 7_305_001
+
+
+async def _current_version(conn: asyncpg.Connection) -> int:
+    if not await conn.fetchval("SELECT to_regclass('schema_migrations') IS NOT NULL"):
+        return 0
+    return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+
+
+async def migrate(conn: asyncpg.Connection) -> int:
+    """
+    Применить недостающие миграции. Если схема актуальна — только чтение версии, без DDL.
+    Возвращает текущую версию схемы.
+    """
+    if await _current_version(conn) >= LATEST:
+        return LATEST
+
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", _LOCK_KEY)
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+              version INT PRIMARY KEY,
+              name TEXT NOT NULL,
+              applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """
+        )
+        # пока ждали лок, другая реплика могла уже всё применить
+        current = await _current_version(conn)
+        for version, name, sql in MIGRATIONS:
+            if version <= current:
+                continue
+            await conn.execute(sql)
+            await conn.execute(
+                "INSERT INTO schema_migrations(version, name) VALUES($1, $2)", version, name
+            )
+            print(f"[migrations] applied {version}: {name}")
+    return LATEST
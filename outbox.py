@@ -0,0 +1,121 @@
+import json
+import asyncio
+
+from telegram.error import BadRequest, Forbidden
+
+import metrics
+from db import DB
+
+
+def is_permanent(e: Exception) -> bool:
+    # повтор не поможет: бота убрали из группы, сообщения нет, Telegram отверг запрос
+    return isinstance(e, (Forbidden, BadRequest))
+
+
+class OutboxWorker:
+    """
+    Фоновый разбор таблицы outbox.
+    Берёт пачку готовых событий (по одному головному на (feedback_id, канал) — порядок внутри записи
+    сохраняется, а Sheets и группа друг друга не ждут), выполняет их параллельно через
+    handlers[kind](feedback_id, payload).
+    Успешные удаляются одним запросом, упавшие откладываются с экспоненциальной паузой.
+    Неизвестный kind, Forbidden/BadRequest от Telegram и события, исчерпавшие max_attempts,
+    помечаются status='dead' (bot_outbox_dead_total) и дальше очередь не держат.
+    Просыпается по NOTIFY outbox (см. DB._enqueue) или раз в poll_interval.
+    """
+
+    def __init__(
+        self,
+        db: DB,
+        handlers: dict,
+        batch_size: int = 50,
+        poll_interval: float = 5.0,
+        lease: float = 120.0,
+        max_backoff: float = 300.0,
+        max_attempts: int = 12,
+    ):
+        self.db = db
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+        self.in_flight = 0
+
+    def wake(self, *_args) -> None:
+        self._wake.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # даём дописать текущую пачку, новых не берём
+        self._stopping = True
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            self._wake.clear()
+            try:
+                events = await self.db.claim_outbox(self.batch_size, self.lease)
+            except Exception as e:
+                print(f"[outbox] ERROR: claim failed: {e!r}")
+                events = []
+
+            if events:
+                self.in_flight = len(events)
+                results = await asyncio.gather(*(self._handle(ev) for ev in events))
+                self.in_flight = 0
+                done = [ev["id"] for ev, ok in zip(events, results) if ok]
+                if done:
+                    try:
+                        await self.db.complete_outbox(done)
+                    except Exception as e:
+                        # не удалили — после аренды выполнятся ещё раз
+                        print(f"[outbox] ERROR: complete failed: {e!r}")
+                continue
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _handle(self, ev) -> bool:
+        kind = ev["kind"]
+        fid = ev["feedback_id"]
+        handler = self.handlers.get(kind)
+        if handler is None:
+            await self._bury(ev, f"unknown outbox kind: {kind}")
+            return False
+        try:
+            await handler(fid, json.loads(ev["payload"]))
+            return True
+        except Exception as e:
+            attempt = ev["attempts"] + 1
+            if is_permanent(e) or attempt >= self.max_attempts:
+                await self._bury(ev, repr(e))
+                return False
+            delay = min(self.max_backoff, 2 ** ev["attempts"])
+            print(f"[outbox] WARN: {kind} #{fid} failed (attempt {attempt}): {e!r}, retry in {delay}s")
+            try:
+                await self.db.retry_outbox(ev["id"], delay, repr(e))
+            except Exception as e2:
+                print(f"[outbox] ERROR: retry_outbox failed: {e2!r}")
+            return False
+
+    async def _bury(self, ev, error: str) -> None:
+        print(f"[outbox] ERROR: {ev['kind']} #{ev['feedback_id']} given up (attempt {ev['attempts'] + 1}): {error}")
+        metrics.OUTBOX_DEAD.inc(ev["kind"])
+        try:
+            await self.db.dead_outbox(ev["id"], error)
+        except Exception as e:
+            # не записали — после аренды событие вернётся и будет похоронено снова
+            print(f"[outbox] ERROR: dead_outbox failed: {e!r}")
@@ -0,0 +1,153 @@
+import json
+import pickle
+import asyncio
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from db import DB
+
+
+class PostgresPersistence(BasePersistence):
+    """
+    Persistence для user_data и состояний ConversationHandler в том же Postgres (пул asyncpg из DB).
+    PTB сам отдаёт только «тронутые» записи раз в update_interval; здесь они ещё сверяются
+    с последним записанным значением и все изменения одного прогона уходят одной транзакцией.
+    """
+
+    def __init__(self, db: DB, update_interval: float = 10):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = db
+        # что лежит в БД сейчас (pickle) — чтобы не писать неизменившееся
+        self._written_users: dict[int, bytes] = {}
+        self._written_convs: dict[tuple[str, str], bytes] = {}
+        # накопленные изменения до следующего сброса
+        self._users: dict[int, bytes | None] = {}
+        self._convs: dict[tuple[str, str], bytes | None] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    @property
+    def pending(self) -> int:
+        # изменения, ещё не записанные в БД (не __len__: PTB проверяет persistence на истинность)
+        return len(self._users) + len(self._convs)
+
+    # ---------- load ----------
+    async def get_user_data(self) -> dict[int, dict]:
+        await self.db.connect()
+        result: dict[int, dict] = {}
+        for r in await self.db.load_user_data():
+            self._written_users[r["user_id"]] = bytes(r["data"])
+            result[r["user_id"]] = pickle.loads(r["data"])
+        return result
+
+    async def get_conversations(self, name: str) -> dict:
+        await self.db.connect()
+        result = {}
+        for r in await self.db.load_conversations(name):
+            self._written_convs[(name, r["key"])] = bytes(r["state"])
+            result[tuple(json.loads(r["key"]))] = pickle.loads(r["state"])
+        return result
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    # ---------- write (coalesced) ----------
+    def _schedule(self) -> None:
+        # все update_* одного прогона PTB вызываются разом — сбросим их одной пачкой
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_pending())
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        blob = pickle.dumps(data)
+        if self._written_users.get(user_id) == blob:
+            self._users.pop(user_id, None)
+            return
+        self._users[user_id] = blob
+        self._schedule()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        if user_id in self._written_users or user_id in self._users:
+            self._users[user_id] = None
+            self._schedule()
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        k = (name, json.dumps(list(key)))
+        if new_state is None:
+            if k in self._written_convs or k in self._convs:
+                self._convs[k] = None
+                self._schedule()
+            return
+        blob = pickle.dumps(new_state)
+        if self._written_convs.get(k) == blob:
+            self._convs.pop(k, None)
+            return
+        self._convs[k] = blob
+        self._schedule()
+
+    async def _flush_pending(self) -> None:
+        await asyncio.sleep(0)
+        # пока пишем, могли накопиться новые изменения — дописываем их следующей пачкой
+        while self._users or self._convs:
+            users, self._users = self._users, {}
+            convs, self._convs = self._convs, {}
+            try:
+                await self.db.save_persistence(
+                    [(uid, blob) for uid, blob in users.items() if blob is not None],
+                    [uid for uid, blob in users.items() if blob is None],
+                    [(name, key, blob) for (name, key), blob in convs.items() if blob is not None],
+                    [k for k, blob in convs.items() if blob is None],
+                )
+            except Exception as e:
+                print(f"[persistence] ERROR: flush failed: {e!r}")
+                # вернём в очередь (не затирая более свежие изменения) — попробуем в следующий прогон
+                for uid, blob in users.items():
+                    self._users.setdefault(uid, blob)
+                for k, blob in convs.items():
+                    self._convs.setdefault(k, blob)
+                return
+
+            for uid, blob in users.items():
+                if blob is None:
+                    self._written_users.pop(uid, None)
+                else:
+                    self._written_users[uid] = blob
+            for k, blob in convs.items():
+                if blob is None:
+                    self._written_convs.pop(k, None)
+                else:
+                    self._written_convs[k] = blob
+
+    async def flush(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._flush_pending()
+
+    # ---------- не используются ----------
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
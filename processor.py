@@ -0,0 +1,51 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Апдейты разных чатов обрабатываются параллельно (до max_concurrent_updates),
+    внутри одного чата — строго по очереди, чтобы ConversationHandler не ловил гонки.
+    Слот параллельности выдаёт базовый process_update (он final), лок чата берётся
+    в do_process_update — документированной точке расширения PTB. Апдейты, ждущие свой чат,
+    занимают слоты, поэтому UPDATE_CONCURRENCY берётся с запасом над числом активных чатов.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # ключ чата -> [lock, сколько апдейтов его держат/ждут]
+        self._locks: dict[int, list] = {}
+
+    @staticmethod
+    def _key(update: object) -> int | None:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
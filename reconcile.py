@@ -0,0 +1,145 @@
+"""
+Сверка Postgres ↔ Google Sheets: лист читается одним get_all_values, feedback — потоком из БД.
+Расхождения чинятся минимумом вызовов: одно batch_update на правки, одно удаление строк, одно append_rows.
+
+    python reconcile.py           # только отчёт
+    python reconcile.py --apply   # отчёт + исправления
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+from datetime import date, datetime
+
+from dotenv import load_dotenv
+
+import sheets
+from db import DB, sheet_payload
+
+_DATE_FORMATS = ("%d/%m/%y", "%d/%m/%Y", "%d.%m.%y", "%d.%m.%Y", "%Y-%m-%d")
+
+
+def _as_date(s: str) -> date | None:
+    s = (s or "").strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def _cell(row: list[str], i: int) -> str:
+    return (row[i] if i < len(row) else "").strip()
+
+
+def _same(sheet_row: list[str], values: list[str]) -> bool:
+    # дату Sheets может показать в своём формате (USER_ENTERED) — сравниваем как даты
+    d_sheet, d_db = _as_date(_cell(sheet_row, 1)), _as_date(values[1])
+    if (d_sheet or _cell(sheet_row, 1)) != (d_db or values[1]):
+        return False
+    return all(_cell(sheet_row, i) == values[i].strip() for i in (2, 3, 4))
+
+
+class Plan:
+    """
+    Что не так и что с этим делать. Номера строк — как в листе (с 1), до любых правок.
+    """
+
+    def __init__(self):
+        self.checked = 0
+        self.missing: dict[str, list[str]] = {}  # ID -> строка: есть в БД, нет в листе
+        self.stale: dict[int, list[str]] = {}  # номер строки -> актуальные значения
+        self.orphaned: list[int] = []  # строки с ID, которого нет в БД
+        self.duplicates: list[int] = []  # повторы ID (кроме первой строки)
+        self.unknown = 0  # строки без числового ID (заголовок, ручные пометки) — не трогаем
+
+    @property
+    def clean(self) -> bool:
+        return not (self.missing or self.stale or self.orphaned or self.duplicates)
+
+    def summary(self) -> str:
+        return (
+            f"Проверено записей: {self.checked}\n"
+            f"Нет в таблице: {len(self.missing)}\n"
+            f"Устаревшие строки: {len(self.stale)}\n"
+            f"Лишние строки (нет в БД): {len(self.orphaned)}\n"
+            f"Дубли ID: {len(self.duplicates)}\n"
+            f"Строки без ID (пропущены): {self.unknown}"
+        )
+
+
+async def build_plan(db: DB, sheet: list[list[str]]) -> Plan:
+    plan = Plan()
+
+    # ID -> первая строка; повторы — сразу в удаление
+    first: dict[str, int] = {}
+    for i, row in enumerate(sheet, start=1):
+        fid = _cell(row, 0)
+        if not fid.isdigit():
+            plan.unknown += 1
+            continue
+        if fid in first:
+            plan.duplicates.append(i)
+        else:
+            first[fid] = i
+
+    seen: set[str] = set()
+    async for rows in db.iter_feedback(date.min, date.max):
+        for r in rows:
+            plan.checked += 1
+            fid = str(r["id"])
+            p = sheet_payload(r)
+            values = [fid, p["date"], p["dish"], p["comment"], p["reply"] or ""]
+            row_idx = first.get(fid)
+            if row_idx is None:
+                plan.missing[fid] = values
+                continue
+            seen.add(fid)
+            if not _same(sheet[row_idx - 1], values):
+                plan.stale[row_idx] = values
+
+    plan.orphaned = sorted(row_idx for fid, row_idx in first.items() if fid not in seen)
+    return plan
+
+
+async def reconcile(db: DB, apply: bool = False, writer: sheets.SheetsWriter | None = None) -> Plan:
+    """
+    Построить план расхождений и (apply=True) исправить лист.
+    writer — очередь записи бота: на время сверки её пачки не пишутся, чтобы не сдвигать строки.
+    """
+
+    async def run() -> Plan:
+        sheet = await asyncio.to_thread(sheets.read_all_rows)
+        plan = await build_plan(db, sheet)
+        if apply and not plan.clean:
+            await asyncio.to_thread(
+                sheets.apply_fixes, plan.stale, plan.orphaned + plan.duplicates, list(plan.missing.values())
+            )
+        return plan
+
+    if writer is None:
+        return await run()
+    async with writer.exclusive():
+        return await run()
+
+
+async def _main(apply: bool) -> int:
+    db = DB(os.environ["DATABASE_URL"])
+    await db.connect()
+    try:
+        plan = await reconcile(db, apply=apply)
+    finally:
+        await db.close()
+    print(plan.summary())
+    if apply and not plan.clean:
+        print("Исправлено.")
+    return 0 if plan.clean or apply else 1
+
+
+if __name__ == "__main__":
+    load_dotenv(dotenv_path=".env")
+    ap = argparse.ArgumentParser(description="Reconcile feedback table with the Google Sheet")
+    ap.add_argument("--apply", action="store_true", help="fix the sheet, not only report")
+    sys.exit(asyncio.run(_main(ap.parse_args().apply)))
@@ -1,73 +1,232 @@
 import os
 import json
+import asyncio
+import re
+import threading
+from contextlib import asynccontextmanager
+
 import gspread
+from google.auth.exceptions import RefreshError
 from google.oauth2.service_account import Credentials
+from gspread.exceptions import APIError
+
+import metrics
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 
-def _client():
-    info = json.loads(os.environ["GOOGLE_CREDENTIALS_JSON"])
-    creds = Credentials.from_service_account_info(info, scopes=SCOPES)
-    return gspread.authorize(creds)
+# Клиент и лист живут весь процесс: токен обновляется сам (AuthorizedSession),
+# при ошибке авторизации пересоздаём их один раз.
+_lock = threading.RLock()
+_gc: gspread.Client | None = None
+_worksheet: gspread.Worksheet | None = None
 
-def _ws():
-    sheet_id = os.environ["GOOGLE_SHEET_ID"]
-    worksheet_name = os.environ.get("GOOGLE_WORKSHEET", "Sheet1")
-    gc = _client()
-    sh = gc.open_by_key(sheet_id)
-    return sh.worksheet(worksheet_name)
 
-def append_feedback_row(feedback_id: int, date_str: str, dish: str, guest_comment: str, kitchen_reply: str | None):
-    ws = _ws()
-    ws.append_row(
-        [str(feedback_id), date_str, dish, guest_comment, kitchen_reply or ""],
-        value_input_option="USER_ENTERED",
-    )
+def _client() -> gspread.Client:
+    global _gc
+    with _lock:
+        if _gc is None:
+            info = json.loads(os.environ["GOOGLE_CREDENTIALS_JSON"])
+            creds = Credentials.from_service_account_info(info, scopes=SCOPES)
+            _gc = gspread.authorize(creds)
+        return _gc
 
-def delete_feedback_row(fid: int):
-    ws = _ws()
+
+def _ws() -> gspread.Worksheet:
+    global _worksheet
+    with _lock:
+        if _worksheet is None:
+            sheet_id = os.environ["GOOGLE_SHEET_ID"]
+            worksheet_name = os.environ.get("GOOGLE_WORKSHEET", "Sheet1")
+            sh = _client().open_by_key(sheet_id)
+            _worksheet = sh.worksheet(worksheet_name)
+        return _worksheet
+
+
+def _reset() -> None:
+    global _gc, _worksheet
+    with _lock:
+        _gc = None
+        _worksheet = None
+
+
+def _call(fn):
+    """
+    Выполнить fn(ws) на закэшированном листе.
+    Если токен/сессия протухли (401, RefreshError) — переподключаемся и повторяем один раз.
+    """
+    try:
+        return fn(_ws())
+    except (APIError, RefreshError) as e:
+        if isinstance(e, APIError) and e.code != 401:
+            raise
+        print(f"[sheets] WARN: auth error ({e}), reconnecting")
+        _reset()
+        return fn(_ws())
+
+
+def _norm_id(x: str | None) -> str:
+    x = (x or "").strip()
+    # если Google Sheets вернул "123.0"
+    if x.endswith(".0") and x[:-2].isdigit():
+        x = x[:-2]
+    return x
+
+
+def _literal(row: list) -> list:
+    """
+    Строка для записи с USER_ENTERED: ID и дата разбираются Sheets (число, дата), а блюдо, комментарий
+    и ответ — всегда текст. Без апострофа «+1», «1/2» или «=…» стали бы числом, датой или формулой,
+    и сверка видела бы их устаревшими при каждом прогоне. Апостроф Sheets не показывает и не отдаёт.
+    """
+    return [*row[:2], *(f"'{v}" if v else v for v in row[2:])]
+
+
+# ID -> номер строки листа. Строится один раз по столбцу A,
+# дальше поддерживается при append/delete и проверяется одной ячейкой перед записью.
+_rows: dict[str, int] | None = None
+
+
+def _build_rows(ws: gspread.Worksheet) -> dict[str, int]:
+    rows: dict[str, int] = {}
+    for i, v in enumerate(ws.col_values(1), start=1):
+        rows.setdefault(_norm_id(v), i)
+    return rows
+
+
+def _ensure_rows(ws: gspread.Worksheet) -> dict[str, int]:
+    global _rows
+    if _rows is None:
+        _rows = _build_rows(ws)
+    return _rows
+
+
+def _find_rows(ws: gspread.Worksheet, fids: list[str]) -> dict[str, int]:
+    """
+    Номера строк для набора ID: берём из кэша и проверяем все разом одним batch_get.
+    Если чего-то нет или не совпало (лист правили руками) — перечитываем столбец A.
+    """
+    global _rows
+    if _rows is not None:
+        found = {fid: _rows[fid] for fid in fids if fid in _rows}
+        if len(found) == len(fids):
+            cells = ws.batch_get([f"A{r}" for r in found.values()])
+            actual = [_norm_id(c[0][0] if c and c[0] else "") for c in cells]
+            if actual == list(found.keys()):
+                return found
+    _rows = _build_rows(ws)
+    return {fid: _rows[fid] for fid in fids if fid in _rows}
+
+
+def _find_row(ws: gspread.Worksheet, fid: int) -> int | None:
     target = str(fid).strip()
+    return _find_rows(ws, [target]).get(target)
+
+
+def _appended_row(resp) -> int | None:
+    # {"updates": {"updatedRange": "Sheet1!A15:E15", ...}}
+    rng = ((resp or {}).get("updates") or {}).get("updatedRange") or ""
+    m = re.search(r"![A-Z]+(\d+)", rng)
+    return int(m.group(1)) if m else None
+
+
+def _remember_rows(start_row: int | None, ids: list[str]) -> None:
+    global _rows
+    if _rows is None:
+        return
+    if start_row is None:
+        # не смогли понять, куда легли строки — при следующем поиске перечитаем
+        _rows = None
+        return
+    for i, fid in enumerate(ids):
+        _rows.setdefault(fid, start_row + i)
+
 
-    col = ws.col_values(1)  # столбец ID
+def _forget_row(row_idx: int) -> None:
+    # строки ниже удалённой сдвигаются на одну вверх
+    if _rows is None:
+        return
+    for fid in [k for k, v in _rows.items() if v == row_idx]:
+        del _rows[fid]
+    for fid, v in _rows.items():
+        if v > row_idx:
+            _rows[fid] = v - 1
 
-    def norm(x: str) -> str:
-        x = (x or "").strip()
-        if x.endswith(".0") and x.replace(".0", "").isdigit():
-            x = x[:-2]
-        return x
 
-    row_idx = None
-    for i, v in enumerate(col, start=1):
-        if norm(v) == target:
-            row_idx = i
-            break
+def _update_rows(ws: gspread.Worksheet, updates: dict[str, list]) -> None:
+    rows = _find_rows(ws, list(updates))
+    data = [
+        {"range": f"A{row_idx}:E{row_idx}", "values": [_literal(updates[fid])]}
+        for fid, row_idx in rows.items()
+    ]
+    if data:
+        ws.batch_update(data, value_input_option="USER_ENTERED")
+
+    missing = [fid for fid in updates if fid not in rows]
+    if missing:
+        # Не нашли строки — НЕ теряем данные, добавляем как новые
+        resp = ws.append_rows([_literal(updates[fid]) for fid in missing], value_input_option="USER_ENTERED")
+        _remember_rows(_appended_row(resp), missing)
+        print(f"[sheets] WARN: rows with ID={','.join(missing)} not found, appended new rows")
 
+
+def _delete_rows(ws: gspread.Worksheet, fids: list[str]) -> None:
+    rows = list(_find_rows(ws, fids).values())
+    if len(rows) < len(fids):
+        print(f"[sheets] WARN: {len(fids) - len(rows)} row(s) to delete not found")
+    _delete_row_numbers(ws, rows)
+
+
+def _delete_row_numbers(ws: gspread.Worksheet, rows: list[int]) -> None:
+    """
+    Удалить строки по номерам одним batch_update листа.
+    """
+    rows = sorted(set(rows), reverse=True)
+    if not rows:
+        return
+    # снизу вверх, чтобы индексы ещё не удалённых строк не съезжали
+    ws.spreadsheet.batch_update({
+        "requests": [
+            {
+                "deleteDimension": {
+                    "range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": r - 1, "endIndex": r}
+                }
+            }
+            for r in rows
+        ]
+    })
+    for r in rows:
+        _forget_row(r)
+
+
+def append_feedback_row(feedback_id: int, date_str: str, dish: str, guest_comment: str, kitchen_reply: str | None):
+    values = [str(feedback_id), date_str, dish, guest_comment, kitchen_reply or ""]
+    with _lock, metrics.timed(metrics.SHEETS_SECONDS, metrics.SHEETS_ERRORS, "append_row"):
+        resp = _call(lambda ws: ws.append_row(_literal(values), value_input_option="USER_ENTERED"))
+        _remember_rows(_appended_row(resp), [values[0]])
+
+
+def delete_feedback_row(fid: int):
+    with _lock, metrics.timed(metrics.SHEETS_SECONDS, metrics.SHEETS_ERRORS, "delete_row"):
+        _call(lambda ws: _delete_row(ws, fid))
+
+
+def _delete_row(ws: gspread.Worksheet, fid: int):
+    row_idx = _find_row(ws, fid)
     if row_idx is None:
         print(f"[sheets] WARN: row with ID={fid} not found, nothing to delete")
         return
 
     ws.delete_rows(row_idx)
+    _forget_row(row_idx)
 
-def update_feedback_row(fid: int, date_str: str, dish: str, comment: str, reply: str | None):
-    ws = _ws()
-
-    target = str(fid).strip()
 
-    # Берём весь столбец A (ID)
-    col = ws.col_values(1)  # список строк, включая заголовок
-    row_idx = None
+def update_feedback_row(fid: int, date_str: str, dish: str, comment: str, reply: str | None):
+    with _lock, metrics.timed(metrics.SHEETS_SECONDS, metrics.SHEETS_ERRORS, "update_row"):
+        _call(lambda ws: _update_row(ws, fid, date_str, dish, comment, reply))
 
-    def norm(x: str) -> str:
-        x = (x or "").strip()
-        # если Google Sheets вернул "123.0"
-        if x.endswith(".0") and x.replace(".0", "").isdigit():
-            x = x[:-2]
-        return x
 
-    for i, v in enumerate(col, start=1):
-        if norm(v) == target:
-            row_idx = i
-            break
+def _update_row(ws: gspread.Worksheet, fid: int, date_str: str, dish: str, comment: str, reply: str | None):
+    row_idx = _find_row(ws, fid)
 
     values = [
         str(fid),
@@ -79,10 +238,218 @@ def update_feedback_row(fid: int, date_str: str, dish: str, comment: str, reply:
 
     if row_idx is None:
         # Не нашли строку — НЕ теряем данные, добавляем как новую
-        ws.append_row(values, value_input_option="USER_ENTERED")
+        resp = ws.append_row(_literal(values), value_input_option="USER_ENTERED")
+        _remember_rows(_appended_row(resp), [values[0]])
         print(f"[sheets] WARN: row with ID={fid} not found, appended new row")
         return
 
     # Обновляем диапазон A:E в найденной строке
-    ws.update(f"A{row_idx}:E{row_idx}", [values], value_input_option="USER_ENTERED")
+    ws.update(f"A{row_idx}:E{row_idx}", [_literal(values)], value_input_option="USER_ENTERED")
+
+
+def _write_batch(
+    appends: dict[str, list],
+    updates: dict[str, list],
+    deletes: list[str],
+) -> tuple[Exception | None, Exception | None, Exception | None]:
+    """
+    Одна пачка: новые строки одним append_rows, правки одним batch_update,
+    удаления одним batch_update листа. Ошибка каждого шага возвращается отдельно.
+    """
+    errors: list[Exception | None] = [None, None, None]
+    retried: dict[str, list] = {}
+    with _lock:
+        if appends:
+            # повторная отправка уже записанной строки (ретрай после падения между записью в лист
+            # и complete_outbox) — обновляем, а не дублируем. Карта строк нужна и после рестарта.
+            try:
+                rows = _call(_ensure_rows)
+            except Exception as e:
+                errors[0] = e
+                appends = {}
+            else:
+                retried = {fid: v for fid, v in appends.items() if fid in rows}
+                if retried:
+                    updates = {**updates, **retried}
+                    appends = {k: v for k, v in appends.items() if k not in retried}
+        if appends:
+            try:
+                with metrics.timed(metrics.SHEETS_SECONDS, metrics.SHEETS_ERRORS, "batch_append"):
+                    resp = _call(lambda ws: ws.append_rows([_literal(v) for v in appends.values()], value_input_option="USER_ENTERED"))
+                    _remember_rows(_appended_row(resp), list(appends))
+            except Exception as e:
+                errors[0] = e
+        if updates:
+            try:
+                with metrics.timed(metrics.SHEETS_SECONDS, metrics.SHEETS_ERRORS, "batch_update"):
+                    _call(lambda ws: _update_rows(ws, updates))
+            except Exception as e:
+                errors[1] = e
+                if retried and errors[0] is None:
+                    # ретраи ушли в правки — их неудача тоже неудача append
+                    errors[0] = e
+        if deletes:
+            try:
+                with metrics.timed(metrics.SHEETS_SECONDS, metrics.SHEETS_ERRORS, "batch_delete"):
+                    _call(lambda ws: _delete_rows(ws, deletes))
+            except Exception as e:
+                errors[2] = e
+    return errors[0], errors[1], errors[2]
+
+
+def read_all_rows() -> list[list[str]]:
+    """
+    Весь лист одним get_all_values (для сверки с БД). ID в столбце A уже нормализован ("123.0" -> "123").
+    """
+    with _lock, metrics.timed(metrics.SHEETS_SECONDS, metrics.SHEETS_ERRORS, "read_all"):
+        values = _call(lambda ws: ws.get_all_values())
+    return [[_norm_id(row[0]), *row[1:]] if row else [] for row in values]
+
+
+def apply_fixes(stale: dict[int, list], delete_rows: list[int], append: list[list]) -> None:
+    """
+    Исправления сверки, номера строк — как в прочитанном листе: правки одним batch_update,
+    удаления одним batch_update листа, недостающие строки одним append_rows.
+    Карта ID -> строка после этого собирается заново.
+    """
+
+    def fix(ws: gspread.Worksheet) -> None:
+        global _rows
+        # правки — пока номера строк ещё исходные
+        if stale:
+            ws.batch_update(
+                [{"range": f"A{r}:E{r}", "values": [_literal(v)]} for r, v in stale.items()],
+                value_input_option="USER_ENTERED",
+            )
+        _delete_row_numbers(ws, delete_rows)
+        if append:
+            ws.append_rows([_literal(v) for v in append], value_input_option="USER_ENTERED")
+        _rows = _build_rows(ws)
+
+    with _lock, metrics.timed(metrics.SHEETS_SECONDS, metrics.SHEETS_ERRORS, "apply_fixes"):
+        _call(fix)
+
+
+def _log_failure(fut: asyncio.Future) -> None:
+    if not fut.cancelled() and fut.exception() is not None:
+        print(f"[sheets] ERROR: write failed: {fut.exception()!r}")
+
+
+class SheetsWriter:
+    """
+    Write-behind очередь записей в Google Sheets.
+    Копит операции и сбрасывает их пачкой по размеру (max_batch) или по времени (flush_interval).
+    Несколько правок одного ID схлопываются в одну запись; правка ещё не отправленной
+    строки попадает прямо в append, удаление неотправленной строки отменяет её целиком.
+    Каждая операция возвращает future, который завершается после записи её пачки.
+    """
+
+    def __init__(self, flush_interval: float = 2.0, max_batch: int = 50):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        # fid -> (значения строки, futures операций, которые в неё схлопнулись)
+        self._appends: dict[str, tuple[list, list[asyncio.Future]]] = {}
+        self._updates: dict[str, tuple[list, list[asyncio.Future]]] = {}
+        self._deletes: dict[str, list[asyncio.Future]] = {}
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._appends) + len(self._updates) + len(self._deletes)
+
+    @asynccontextmanager
+    async def exclusive(self):
+        """
+        Сбросить очередь и не пускать новые пачки, пока лист правит кто-то другой (сверка).
+        """
+        await self.flush()
+        async with self._flush_lock:
+            yield
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def _future(self) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        fut.add_done_callback(_log_failure)
+        if len(self) >= self.max_batch:
+            self._wake.set()
+        return fut
+
+    def append(self, fid: int, date_str: str, dish: str, comment: str, reply: str | None) -> asyncio.Future:
+        key = str(fid)
+        fut = self._future()
+        self._appends[key] = ([key, date_str, dish, comment, reply or ""], [fut])
+        return fut
+
+    def update(self, fid: int, date_str: str, dish: str, comment: str, reply: str | None) -> asyncio.Future:
+        key = str(fid)
+        fut = self._future()
+        values = [key, date_str, dish, comment, reply or ""]
+        pending = self._appends if key in self._appends else self._updates
+        futs = pending[key][1] if key in pending else []
+        pending[key] = (values, futs + [fut])
+        return fut
+
+    def delete(self, fid: int) -> asyncio.Future:
+        key = str(fid)
+        fut = self._future()
+        if key in self._appends:
+            # строка так и не ушла в таблицу — писать нечего
+            _, futs = self._appends.pop(key)
+            for f in futs + [fut]:
+                f.set_result(None)
+            return fut
+        _, futs = self._updates.pop(key, (None, []))
+        self._deletes[key] = self._deletes.get(key, []) + futs + [fut]
+        return fut
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not len(self):
+                return
+            appends, self._appends = self._appends, {}
+            updates, self._updates = self._updates, {}
+            deletes, self._deletes = self._deletes, {}
+
+            errors = await asyncio.to_thread(
+                _write_batch,
+                {k: v for k, (v, _) in appends.items()},
+                {k: v for k, (v, _) in updates.items()},
+                list(deletes),
+            )
 
+            groups = (
+                [f for _, futs in appends.values() for f in futs],
+                [f for _, futs in updates.values() for f in futs],
+                [f for futs in deletes.values() for f in futs],
+            )
+            for futs, err in zip(groups, errors):
+                for f in futs:
+                    if f.done():
+                        continue
+                    if err is None:
+                        f.set_result(None)
+                    else:
+                        f.set_exception(err)
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from broadcast import Broadcast, JobLost, TokenBucket, run_with_progress
+
+JOB = {
+    "id": 1, "text": "меню на завтра", "admin_chat_id": None, "progress_message_id": None,
+    "last_chat_id": None, "total": 4, "sent": 0, "failed": 0,
+}
+
+
+class Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+
+class JobsDB:
+    """Подписчики 1..4 страницами по 2; owned — чья аренда у задания."""
+
+    def __init__(self, owned: bool = True, fail_page: bool = False):
+        self.owned = owned
+        self.fail_page = fail_page
+        self.status = "running"
+
+    async def broadcast_page(self, job_id, after, limit):
+        if self.fail_page and after is not None:
+            raise ConnectionError("db down")
+        return [c for c in (1, 2, 3, 4) if after is None or c > after][:limit]
+
+    async def record_deliveries(self, job_id, results, last_chat_id, dead, owner):
+        return self.owned
+
+    async def heartbeat_broadcast_job(self, job_id, owner):
+        return self.owned
+
+    async def finish_broadcast_job(self, job_id):
+        self.status = "done"
+
+    async def fail_broadcast_job(self, job_id, owner, error):
+        self.status = "failed"
+
+
+def _broadcast(db: JobsDB, bot: Bot) -> Broadcast:
+    return Broadcast(bot, TokenBucket(rate=1000), db, JOB, owner="a", page_size=2)
+
+
+def test_stops_when_lease_is_taken_over():
+    db, bot = JobsDB(owned=False), Bot()
+    with pytest.raises(JobLost):
+        asyncio.run(_broadcast(db, bot).run())
+    # первая страница ушла до того, как узнали о перехвате, дальше — ни одной
+    assert sorted(bot.sent) == [1, 2]
+    assert db.status == "running"
+
+
+def test_crashed_job_is_marked_failed():
+    db, bot = JobsDB(fail_page=True), Bot()
+    asyncio.run(run_with_progress(_broadcast(db, bot)))
+    assert db.status == "failed"
+
+
+def test_lost_job_is_left_to_new_owner():
+    db, bot = JobsDB(owned=False), Bot()
+    asyncio.run(run_with_progress(_broadcast(db, bot)))
+    assert db.status == "running"
@@ -0,0 +1,97 @@
+import heapq
+import itertools
+
+import pytest
+
+from dish_index import DishIndex, normalize
+
+NAMES = [
+    "Борщ",
+    "Борщ украинский",
+    "Зелёный борщ",
+    "Салат Цезарь",
+    "Цезарь с курицей",
+    "Салат оливье",
+    "Ёжики в томате",
+    "Суп грибной",
+    "Грибной суп-пюре",
+    "Котлета по-киевски",
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    idx = DishIndex()
+    idx.load(NAMES)
+    return idx
+
+
+@pytest.mark.parametrize(
+    "query, limit, expected",
+    [
+        # точное совпадение — первым, дальше начинающиеся с запроса, потом остальные
+        ("борщ", 10, ["Борщ", "Борщ украинский", "Зелёный борщ"]),
+        ("бор", 10, ["Борщ", "Борщ украинский", "Зелёный борщ"]),
+        ("  БОРЩ  ", 10, ["Борщ", "Борщ украинский", "Зелёный борщ"]),
+        # ё/е и регистр — в обе стороны
+        ("ежики", 10, ["Ёжики в томате"]),
+        ("ЁЖИКИ", 10, ["Ёжики в томате"]),
+        ("зеленый", 10, ["Зелёный борщ"]),
+        # подстрока не с начала слова — ниже начал слов
+        ("рибн", 10, ["Суп грибной", "Грибной суп-пюре"]),
+        ("гриб", 10, ["Грибной суп-пюре", "Суп грибной"]),
+        # порог limit
+        ("борщ", 2, ["Борщ", "Борщ украинский"]),
+        ("салат", 1, ["Салат Цезарь"]),  # при равной длине — по названию
+        # короткие и пустые запросы
+        ("б", 10, []),
+        ("", 10, []),
+        ("пицца", 10, []),
+    ],
+)
+def test_search(index, query, limit, expected):
+    assert index.search(query, limit=limit) == expected
+
+
+@pytest.mark.parametrize("a, b", [("салат цезарь", "цезарь салат"), ("суп гриб", "гриб суп"), ("по-к кот", "кот по-к")])
+def test_token_order_does_not_matter(index, a, b):
+    assert index.search(a) == index.search(b)
+    assert index.search(a)
+
+
+def test_falls_back_to_first_token(index):
+    # по всем словам пусто — ищем по первому
+    assert sorted(index.search("борщ пицца")) == sorted(index.search("борщ"))
+    assert index.search("пицца борщ") == []
+
+
+def test_add_remove(index):
+    idx = DishIndex()
+    idx.load(NAMES)
+    idx.add("Борщ с пампушками")
+    assert "Борщ с пампушками" in idx.search("пампуш")
+    idx.remove("Борщ")
+    assert idx.search("борщ")[0] == "Борщ украинский"
+    assert "Борщ" not in idx
+
+
+def _catalog() -> list[str]:
+    words = ["борщ", "салат", "суп", "сырники", "сельдь", "котлета", "каша", "компот", "курица", "кабачки", "ёжики"]
+    tails = ["домашний", "с курицей", "по-киевски", "сливочный", "с сыром", "острый", "ёлочкой", "из печи"]
+    return [f"{w} {t} {i}".capitalize() for i, (w, t) in enumerate(itertools.product(words, tails * 6))]
+
+
+def _reference(idx: DishIndex, query: str, limit: int) -> list[str]:
+    # медленный путь: все кандидаты по подстрокам, полный ключ ранжирования
+    q = normalize(query)
+    tokens = list(dict.fromkeys(p for p in q.split(" ") if len(p) >= 2)) or q.split(" ")
+    found = idx._match(tokens) or (idx._match(tokens[:1]) if len(tokens) > 1 else set())
+    return heapq.nsmallest(limit, found, key=lambda name: idx._rank(name, q, tokens))
+
+
+@pytest.mark.parametrize("query", ["су", "сыр", "сырники", "ка", "кур", "с кур", "кур с", "по-ки кот", "ежик", "олоч", "печи", "суп с сыром 1"])
+@pytest.mark.parametrize("limit", [1, 5, 10, 50])
+def test_word_start_fast_path_matches_full_ranking(query, limit):
+    idx = DishIndex()
+    idx.load(_catalog())
+    assert idx.search(query, limit=limit) == _reference(idx, query, limit)
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import date
+
+from telegram.error import Forbidden
+
+from fakes import FakeDB
+from outbox import OutboxWorker
+
+
+def _run(db: FakeDB, handlers: dict, **kwargs) -> list[tuple[str, int]]:
+    async def go():
+        worker = OutboxWorker(db, handlers, poll_interval=0.01, max_backoff=0.0, **kwargs)
+        worker.start()
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            if all(ev["status"] == "dead" for ev in db.outbox.values()):
+                break
+        await worker.stop()
+
+    asyncio.run(go())
+    return sorted((ev["kind"], ev["attempts"]) for ev in db.outbox.values())
+
+
+def test_broken_group_post_does_not_block_sheets():
+    done = []
+
+    async def ok(fid, p):
+        done.append(fid)
+
+    async def forbidden(fid, p):
+        raise Forbidden("bot was kicked from the supergroup chat")
+
+    db = FakeDB([])
+    db._enqueue(1, [("group_publish", {}), ("sheets_append", {}), ("sheets_update", {}), ("group_delete", {})])
+    left = _run(db, {"group_publish": forbidden, "group_delete": ok, "sheets_append": ok, "sheets_update": ok})
+
+    # Forbidden — сразу в dead, без повторов; всё остальное выполнено
+    assert left == [("group_publish", 1)]
+    assert done == [1, 1, 1]
+
+
+def test_unknown_kind_and_exhausted_attempts_are_dead():
+    async def flaky(fid, p):
+        raise ConnectionError("sheets down")
+
+    db = FakeDB([])
+    db._enqueue(1, [("sheets_append", {})])
+    db._enqueue(2, [("mystery", {})])
+    left = _run(db, {"sheets_append": flaky}, max_attempts=3)
+
+    assert left == [("mystery", 1), ("sheets_append", 3)]
+
+
+def test_publish_cleans_up_when_record_deleted_meanwhile(monkeypatch):
+    import main
+
+    class Msg:
+        chat_id, message_id = -100, 7
+
+    class Bot:
+        def __init__(self, db):
+            self.db = db
+            self.deleted = []
+
+        async def send_message(self, **kwargs):
+            # запись удаляют, пока сообщение летит в группу: ссылок на него ещё нет
+            await self.db.delete_feedback(1)
+            return Msg()
+
+        async def delete_message(self, chat_id, message_id):
+            self.deleted.append((chat_id, message_id))
+
+    async def go():
+        db = FakeDB([])
+        await db.create_feedback(date(2026, 1, 1), "Борщ", "пересолен", "исправим")
+        bot = Bot(db)
+        await main._publish_or_update_group(bot, db, 1)
+        return db, bot
+
+    monkeypatch.setenv("GROUP_CHAT_ID", "-100")
+    db, bot = asyncio.run(go())
+    assert bot.deleted == [(-100, 7)]
+    assert not any(ev["kind"] == "group_delete" for ev in db.outbox.values())
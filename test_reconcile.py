@@ -0,0 +1,97 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+import reconcile
+import sheets
+from fakes import FakeDB
+
+
+def _db(*rows: tuple[str, str, str | None]) -> FakeDB:
+    # записи 1..n за 01/01/26 (как в FakeWorksheet.with_ids)
+    db = FakeDB([])
+
+    async def fill():
+        for dish, comment, reply in rows:
+            await db.create_feedback(date(2026, 1, 1), dish, comment, reply)
+
+    asyncio.run(fill())
+    return db
+
+
+def _plan(db: FakeDB, sheet: list[list[str]]) -> reconcile.Plan:
+    return asyncio.run(reconcile.build_plan(db, sheet))
+
+
+def _row(fid: int, dish: str | None = None, comment: str = "комментарий", reply: str = "", day: str = "01/01/26") -> list[str]:
+    return [str(fid), day, dish or f"Блюдо {fid}", comment, reply]
+
+
+HEADER = ["ID", "Дата", "Блюдо", "Комментарий", "Ответ"]
+
+
+@pytest.fixture
+def db():
+    return _db(*((f"Блюдо {i}", "комментарий", None) for i in range(1, 6)))
+
+
+def test_in_sync(db):
+    plan = _plan(db, [HEADER, *(_row(i) for i in range(1, 6))])
+    assert plan.clean
+    assert plan.checked == 5
+    assert plan.unknown == 1
+
+
+def test_classifies_rows(db):
+    sheet = [
+        HEADER,
+        _row(1),
+        _row(2, comment="старый комментарий"),  # stale
+        _row(4),
+        _row(7),  # orphaned: в БД нет
+        _row(1),  # duplicate
+        ["", "", "пометка руками", "", ""],  # без ID — не трогаем
+        _row(5, day="2026-01-01"),  # дата в другом формате — не stale
+    ]
+    plan = _plan(db, sheet)
+
+    assert plan.missing == {"3": _row(3)}
+    assert plan.stale == {3: _row(2)}
+    assert plan.orphaned == [5]
+    assert plan.duplicates == [6]
+    assert plan.unknown == 2
+
+
+def test_duplicate_keeps_first_row(db):
+    # сравнивается и правится первая строка с ID, повторы — только в удаление
+    sheet = [HEADER, *(_row(i) for i in range(1, 6)), _row(3, comment="повтор"), _row(3)]
+    plan = _plan(db, sheet)
+
+    assert plan.duplicates == [7, 8]
+    assert not plan.stale and not plan.orphaned and not plan.missing
+
+
+@pytest.mark.parametrize("comment", ["+1", "1/2", "=плохо", "+1 к прошлому", "'кавычка", "-"])
+def test_text_written_by_bot_is_not_stale(ws, comment):
+    # что бот записал, то сверка и прочитает: Sheets не превращает текст в число, дату или формулу
+    db = _db(*((f"Блюдо {i}", comment, comment) for i in range(1, 6)))
+    ws.rows[1:] = []
+    for i in range(1, 6):
+        sheets.update_feedback_row(i, "01/01/26", f"Блюдо {i}", comment, comment)
+
+    assert ws.rows[1][3:] == [comment, comment]
+    assert _plan(db, sheets.read_all_rows()).clean
+
+
+def test_apply_fixes(ws, db):
+    asyncio.run(db.update_kitchen_reply(2, "=спасибо"))
+    ws.rows.append(_row(9))
+    ws.rows.append(_row(4))
+    del ws.rows[3]  # ID 3
+
+    plan = asyncio.run(reconcile.reconcile(db, apply=True))
+    assert not plan.clean
+    assert asyncio.run(reconcile.reconcile(db)).clean
+    assert sorted(ws.ids(), key=int) == ["1", "2", "3", "4", "5"]
+    assert ws.rows[2][4] == "=спасибо"
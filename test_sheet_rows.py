@@ -0,0 +1,49 @@
+import sheets
+
+
+def test_find_rows_builds_map_once(ws):
+    assert sheets._find_rows(ws, ["2", "5"]) == {"2": 3, "5": 6}
+    calls = ws.calls
+    assert sheets._find_rows(ws, ["4"]) == {"4": 5}
+    # из кэша: одна проверочная batch_get, без перечитывания столбца A
+    assert ws.calls == calls + 1
+
+
+def test_delete_shifts_rows_below(ws):
+    sheets._find_rows(ws, ["1"])
+    sheets.delete_feedback_row(2)
+
+    assert ws.ids() == ["1", "3", "4", "5"]
+    assert sheets._rows["3"] == 3
+    assert sheets._rows["5"] == 5
+    assert "2" not in sheets._rows
+
+    sheets.update_feedback_row(5, "02/01/26", "Блюдо 5", "комментарий", "ответ")
+    assert ws.rows[4] == ["5", "02/01/26", "Блюдо 5", "комментарий", "ответ"]
+
+
+def test_delete_row_numbers_bottom_up(ws):
+    sheets._find_rows(ws, ["1"])
+    sheets._delete_row_numbers(ws, [3, 5, 3])
+
+    assert ws.ids() == ["1", "3", "5"]
+    assert sheets._rows == {"ID": 1, "1": 2, "3": 3, "5": 4}
+
+
+def test_manual_edit_forces_rebuild(ws):
+    sheets._find_rows(ws, ["1"])
+    # строку вставили руками — кэшированные номера ниже неё устарели
+    ws.rows.insert(2, ["99", "01/01/26", "Вручную", "", ""])
+
+    assert sheets._find_rows(ws, ["4"]) == {"4": 6}
+    sheets.update_feedback_row(4, "03/01/26", "Блюдо 4", "правка", "")
+    assert ws.rows[5][0] == "4"
+    assert ws.rows[5][3] == "правка"
+    assert ws.rows[2][0] == "99"
+
+
+def test_update_of_missing_row_appends(ws):
+    sheets.update_feedback_row(42, "01/01/26", "Новое", "комментарий", None)
+
+    assert ws.ids()[-1] == "42"
+    assert sheets._find_rows(ws, ["42"]) == {"42": 7}
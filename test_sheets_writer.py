@@ -0,0 +1,68 @@
+import asyncio
+
+import sheets
+
+
+def test_update_merges_into_pending_append(ws):
+    async def go():
+        w = sheets.SheetsWriter()
+        futs = [
+            w.append(10, "01/01/26", "Борщ", "пересолен", None),
+            w.update(10, "01/01/26", "Борщ", "пересолен", "исправим"),
+        ]
+        assert len(w) == 1
+        await w.flush()
+        await asyncio.gather(*futs)
+
+    asyncio.run(go())
+    assert ws.ids() == ["1", "2", "3", "4", "5", "10"]
+    assert ws.rows[-1] == ["10", "01/01/26", "Борщ", "пересолен", "исправим"]
+
+
+def test_delete_cancels_pending_append(ws):
+    async def go():
+        w = sheets.SheetsWriter()
+        futs = [
+            w.append(10, "01/01/26", "Борщ", "пересолен", None),
+            w.update(10, "01/01/26", "Борщ", "пересолен", "исправим"),
+            w.delete(10),
+        ]
+        assert len(w) == 0
+        await w.flush()
+        await asyncio.gather(*futs)
+
+    calls = ws.calls
+    asyncio.run(go())
+    assert ws.ids() == ["1", "2", "3", "4", "5"]
+    assert ws.calls == calls
+
+
+def test_retried_append_becomes_update(ws):
+    # рестарт: карты строк нет, а строка уже в листе (упали между записью и complete_outbox)
+    async def go():
+        w = sheets.SheetsWriter()
+        fut = w.append(2, "02/01/26", "Блюдо 2", "повтор", "ответ")
+        await w.flush()
+        await fut
+
+    asyncio.run(go())
+    assert ws.ids() == ["1", "2", "3", "4", "5"]
+    assert ws.rows[2] == ["2", "02/01/26", "Блюдо 2", "повтор", "ответ"]
+
+
+def test_appends_between_batches_are_tracked(ws):
+    async def go():
+        w = sheets.SheetsWriter()
+        f1 = w.append(10, "01/01/26", "Борщ", "первый", None)
+        await w.flush()
+        await f1
+        # та же запись снова (ретрай outbox) и правка другой строки — одна пачка
+        f2 = w.append(10, "01/01/26", "Борщ", "второй", None)
+        f3 = w.update(3, "01/01/26", "Блюдо 3", "правка", "")
+        await w.flush()
+        await asyncio.gather(f2, f3)
+
+    asyncio.run(go())
+    assert ws.ids() == ["1", "2", "3", "4", "5", "10"]
+    assert ws.rows[-1][3] == "второй"
+    assert ws.rows[3][3] == "правка"
@@ -0,0 +1,64 @@
+from datetime import date, timedelta
+
+import pytest
+
+import main
+
+
+def _daily(date_from: date, date_to: date) -> list[dict]:
+    days = (date_to - date_from).days + 1
+    return [{"day": date_from + timedelta(days=i), "total": i % 5, "replied": 0} for i in range(days)]
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        (["01.10.26"], (date(2026, 10, 1), date(2026, 10, 1), [])),
+        (["01.10.26-17.10.26", "борщ"], (date(2026, 10, 1), date(2026, 10, 17), ["борщ"])),
+        (["2026-10-01..2026-10-17"], (date(2026, 10, 1), date(2026, 10, 17), [])),
+        (["борщ"], (None, None, ["борщ"])),
+        ([], (None, None, [])),
+    ],
+)
+def test_parse_period(args, expected):
+    assert main.parse_period(args) == expected
+
+
+def test_parse_period_last_days():
+    date_from, date_to, rest = main.parse_period(["7д"])
+    assert (date_to - date_from).days == 6 and rest == []
+
+
+@pytest.mark.parametrize("arg", ["0д", "0d", "17.10.26-01.10.26"])
+def test_parse_period_rejects_empty_and_reversed(arg):
+    with pytest.raises(ValueError):
+        main.parse_period([arg])
+
+
+@pytest.mark.parametrize(
+    "days, label, points",
+    [
+        (7, "По дням", 7),
+        (60, "По дням", 60),
+        (61, "По неделям", 9),
+        (365, "По неделям", 53),
+        (421, "По месяцам", 15),
+        (9999, "По 6 мес.", 55),
+    ],
+)
+def test_series_buckets(days, label, points):
+    date_to = date(2026, 10, 17)
+    date_from = date_to - timedelta(days=days - 1)
+    got_label, series = main._series(date_from, date_to, _daily(date_from, date_to))
+    assert got_label == label
+    assert len(series) == points
+    assert sum(series) == sum(r["total"] for r in _daily(date_from, date_to))
+
+
+@pytest.mark.parametrize("date_from", [date(2026, 10, 17) - timedelta(days=9998), date(1, 1, 1)])
+def test_stats_text_fits_telegram_limit(date_from):
+    date_to = date(2026, 10, 17)
+    daily = [{"day": date_to, "total": 3, "replied": 1}]
+    dishes = [{"dish_name": f"Блюдо {i}", "total": 3, "replied": 1, "prev_total": 2} for i in range(50)]
+    text = main.stats_text(date_from, date_to, None, dishes, daily)
+    assert len(text) <= 4096